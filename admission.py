@@ -0,0 +1,204 @@
+# Admission control for database-bound routes.
+# Requests beyond the concurrency limit wait in a bounded, prioritised queue; when the
+# queue is full or the wait times out they are rejected early (503 + Retry-After)
+# instead of piling up on the connection pool. A request arriving at a full queue
+# takes the place of the newest lower-priority waiter, if any.
+import asyncio
+import math
+import re
+from collections import deque
+from typing import Iterable, Pattern
+
+from config import DATABASE_POOL_MAX_SIZE
+from logger_setup import logger
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Request rejected, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionRule:
+    def __init__(
+        self,
+        name: str,
+        priority: int,
+        methods: Iterable[str],
+        path: str,
+        max_concurrency: int | None = None,
+        queue_share: float = 1.0,
+    ):
+        """A class of requests. Lower `priority` values are admitted first.
+        `max_concurrency` caps the class on its own and `queue_share` is the
+        fraction of the wait queue it may fill."""
+        self.name = name
+        self.priority = priority
+        self.methods = frozenset(methods)
+        self.path: Pattern = re.compile(path)
+        self.max_concurrency = max_concurrency
+        self.queue_share = queue_share
+
+    def matches(self, method: str, path: str) -> bool:
+        return method in self.methods and self.path.match(path) is not None
+
+
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+DB_ROUTES = r"/(users|addresses|jobs)/"
+
+# First matching rule wins; requests matching no rule bypass admission control
+DEFAULT_ADMISSION_RULES = (
+    AdmissionRule(
+        "bulk",
+        priority=2,
+        methods=WRITE_METHODS,
+        path=r"/users/bulk/",
+        max_concurrency=2,
+        queue_share=0.2,
+    ),
+    # Multi-get: a read sent as POST for its ID list body
+    AdmissionRule("batch_read", priority=0, methods=("POST",), path=r"/users/batch/"),
+    AdmissionRule("write", priority=1, methods=WRITE_METHODS, path=DB_ROUTES),
+    AdmissionRule("read", priority=0, methods=("GET", "HEAD"), path=DB_ROUTES),
+)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        rules: Iterable[AdmissionRule] = DEFAULT_ADMISSION_RULES,
+        limit: int = DATABASE_POOL_MAX_SIZE,
+        min_limit: int = 2,
+        max_queue: int = 100,
+        queue_timeout: float = 2.0,
+        latency_tolerance: float = 2.0,
+    ):
+        """`limit` is the starting (and maximum) number of requests in flight. It is
+        adapted AIMD-style: it shrinks when read latency rises above
+        `latency_tolerance` times the best recently observed latency and grows back
+        slowly while latency stays healthy."""
+        self.rules = tuple(rules)
+        self.limit = float(limit)
+        self.max_limit = limit
+        self.min_limit = min_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.latency = None  # Moving average of read latency (seconds)
+        self.baseline_latency = None  # Best recent read latency (seconds)
+        self._waiters = {}  # priority -> deque of (future, rule)
+        # Per-rule counts, kept here so controllers sharing rules stay independent
+        self._active = dict.fromkeys(self.rules, 0)
+        self._queued = dict.fromkeys(self.rules, 0)
+
+    def match(self, method: str, path: str) -> AdmissionRule | None:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    async def acquire(self, rule: AdmissionRule):
+        """Wait for a slot or raise AdmissionRejected."""
+        if self._can_run(rule) and not self._has_waiters(rule.priority):
+            self._admit(rule)
+            return
+        if self._queued[rule] >= self.max_queue * rule.queue_share or (
+            sum(self._queued.values()) >= self.max_queue
+            and not self._evict_below(rule.priority)
+        ):
+            raise AdmissionRejected(self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(rule.priority, deque()).append((future, rule))
+        self._queued[rule] += 1
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not future.done() or future.cancelled():
+                self._queued[rule] -= 1
+                raise AdmissionRejected(self.retry_after())
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and not future.exception():
+                self.release(rule)  # Admitted just as the client went away
+            elif not future.done() or future.cancelled():
+                self._queued[rule] -= 1  # Evicted waiters are uncounted already
+            raise
+
+    def release(self, rule: AdmissionRule, latency: float | None = None):
+        self.in_flight -= 1
+        self._active[rule] -= 1
+        if latency is not None and rule.priority == 0:
+            self._adapt(latency)
+        self._wake()
+
+    def retry_after(self) -> int:
+        """Seconds a rejected client should wait: time to drain the current queue."""
+        queued = sum(self._queued.values())
+        latency = self.latency or 1.0
+        return max(1, math.ceil(latency * (queued + 1) / max(self.limit, 1)))
+
+    def _can_run(self, rule: AdmissionRule) -> bool:
+        return self.in_flight < int(self.limit) and (
+            rule.max_concurrency is None or self._active[rule] < rule.max_concurrency
+        )
+
+    def _has_waiters(self, priority: int) -> bool:
+        return any(
+            queued for rule, queued in self._queued.items() if rule.priority <= priority
+        )
+
+    def _admit(self, rule: AdmissionRule):
+        self.in_flight += 1
+        self._active[rule] += 1
+
+    def _evict_below(self, priority: int) -> bool:
+        """Make room in a full queue for a request of `priority`: reject the newest
+        waiter of the lowest priority below it. False when there is none, so queued
+        writes can never lock reads out of the queue."""
+        for lower in sorted(self._waiters, reverse=True):
+            if lower <= priority:
+                break
+            waiters = self._waiters[lower]
+            while waiters:
+                future, rule = waiters.pop()
+                if future.done():
+                    continue  # Timed out or cancelled; already uncounted
+                self._queued[rule] -= 1
+                future.set_exception(AdmissionRejected(self.retry_after()))
+                return True
+        return False
+
+    def _wake(self):
+        for priority in sorted(self._waiters):
+            waiters = self._waiters[priority]
+            blocked = deque()
+            while waiters and self.in_flight < int(self.limit):
+                future, rule = waiters.popleft()
+                if future.done():
+                    continue  # Timed out or cancelled; already uncounted
+                if not self._can_run(rule):
+                    blocked.append((future, rule))  # Per-rule cap, keep its place
+                    continue
+                self._queued[rule] -= 1
+                self._admit(rule)
+                future.set_result(None)
+            waiters.extendleft(reversed(blocked))
+
+    def _adapt(self, latency: float):
+        self.latency = (
+            latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+        )
+        # The baseline drifts up slowly so it recovers after a permanent slowdown
+        self.baseline_latency = (
+            latency
+            if self.baseline_latency is None
+            else min(latency, self.baseline_latency * 1.001)
+        )
+        if self.latency > self.latency_tolerance * self.baseline_latency:
+            limit = max(self.min_limit, self.limit * 0.9)
+            if int(limit) < int(self.limit):
+                logger.warning(f"Admission limit lowered to {int(limit)} (latency)")
+            self.limit = limit
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
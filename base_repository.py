@@ -0,0 +1,389 @@
+# Generic async repository for any table declared on `schemas.Base`.
+# Every operation is a single statement: writes use RETURNING instead of a read before
+# and after, and multi-row reads/writes bind the keys as one `= ANY(:ids)` array, so
+# a new model gets batched CRUD by instantiating Repository(Model).
+import contextlib
+import time
+from http import HTTPStatus
+from typing import Any, Dict, Hashable, Iterable, List, Sequence
+from weakref import WeakKeyDictionary, ref
+
+import databases
+from asyncpg.exceptions import IntegrityConstraintViolationError
+from sqlalchemy import (
+    any_,
+    bindparam,
+    cast,
+    column,
+    insert,
+    literal,
+    select,
+    tuple_,
+    values as values_clause,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from starlette.exceptions import HTTPException
+
+from loaders import BatchLoader, in_transaction
+
+BULK_CHUNK_SIZE = 1000  # Rows per multi-row statement, well below the bind-param limit
+
+
+class RowCache:
+    """Caching hook interface. The repository reads through `get_many` and calls
+    `invalidate` after every write, so implementations only need these three methods.
+    The base class caches nothing."""
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        return {}
+
+    def set_many(self, rows: Dict[Hashable, Any]):
+        pass
+
+    def invalidate(self, keys: Iterable[Hashable]):
+        pass
+
+
+class TTLRowCache(RowCache):
+    def __init__(self, ttl: float = 5.0, max_size: int = 10_000):
+        """In-process cache of rows by primary key. Entries expire after `ttl`
+        seconds; other workers' writes are only seen once that happens."""
+        self.ttl = ttl
+        self.max_size = max_size
+        self._rows: Dict[Hashable, tuple] = {}  # key -> (expires_at, row)
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        for key in keys:
+            entry = self._rows.get(key)
+            if entry is not None and entry[0] > now:
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, rows):
+        if len(self._rows) + len(rows) > self.max_size:
+            self._rows.clear()  # Cheaper than LRU bookkeeping on every read
+        expires_at = time.monotonic() + self.ttl
+        for key, row in rows.items():
+            self._rows[key] = (expires_at, row)
+
+    def invalidate(self, keys):
+        for key in keys:
+            self._rows.pop(key, None)
+
+
+class Repository:
+    def __init__(
+        self,
+        model,
+        columns: Sequence = None,
+        name: str = None,
+        cache: RowCache = None,
+        conflict_detail: str = None,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ):
+        """CRUD for `model` keyed by its (single-column) primary key.
+        `columns` are selected and returned by every operation (all columns when
+        None); `name` is used in error messages; `cache` is an optional RowCache and
+        `conflict_detail` the message when a write violates a constraint."""
+        self.model = model
+        self.table = model.__table__
+        (self.pk,) = self.table.primary_key.columns
+        columns = tuple(columns or self.table.columns)
+        # Rows are keyed by primary key, so it is always selected
+        self.columns = columns if self.pk in columns else (self.pk, *columns)
+        self.name = name or model.__name__
+        self.cache = cache
+        self.conflict_detail = (
+            conflict_detail or f"{self.name} conflicts with an existing record"
+        )
+        self.chunk_size = chunk_size
+        self._loaders: "WeakKeyDictionary[databases.Database, BatchLoader]" = (
+            WeakKeyDictionary()
+        )
+
+    # Single array bind parameter for `pk = ANY(:ids)`
+    def _ids_param(self, ids: List):
+        return any_(bindparam("ids", list(ids), type_=ARRAY(self.pk.type)))
+
+    def _chunks(self, rows: List):
+        for start in range(0, len(rows), self.chunk_size):
+            yield rows[start : start + self.chunk_size]
+
+    def not_found(self) -> HTTPException:
+        return HTTPException(
+            status_code=HTTPStatus.NOT_FOUND, detail=f"{self.name} not found"
+        )
+
+    def conflict(self) -> HTTPException:
+        return HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST, detail=self.conflict_detail
+        )
+
+    @contextlib.contextmanager
+    def _conflicts(self):
+        """Turn a unique/foreign-key/check violation into conflict(). `databases`
+        raises the asyncpg error as is, never SQLAlchemy's IntegrityError."""
+        try:
+            yield
+        except IntegrityConstraintViolationError:
+            raise self.conflict()
+
+    def _invalidate(self, ids: Iterable):
+        if self.cache is not None:
+            self.cache.invalidate(ids)
+
+    def loader(self, db: databases.Database) -> BatchLoader:
+        """Per-database loader: get() calls in the same event-loop tick share one
+        get_many() query."""
+        loader = self._loaders.get(db)
+        if loader is None:
+            # Weak reference: the dict value must not keep its key alive
+            db_ref = ref(db)
+            loader = self._loaders[db] = BatchLoader(
+                lambda ids: self.get_many(ids, db_ref())
+            )
+        return loader
+
+    # Read many rows in one round-trip; returns {pk: row} for the rows that exist
+    async def get_many(self, ids: Iterable, db: databases.Database) -> Dict:
+        unique_ids = list(dict.fromkeys(ids))
+        if not unique_ids:
+            return {}
+        rows = self.cache.get_many(unique_ids) if self.cache is not None else {}
+        missing = [key for key in unique_ids if key not in rows]
+        if missing:
+            query = select(*self.columns).where(self.pk == self._ids_param(missing))
+            fetched = {row[self.pk.name]: row for row in await db.fetch_all(query)}
+            if self.cache is not None:
+                self.cache.set_many(fetched)
+            rows.update(fetched)
+        return rows
+
+    # Read one row, batched with concurrent reads; 404 when it does not exist.
+    # Inside a transaction it is read directly, on the transaction's connection.
+    async def get(self, id, db: databases.Database):
+        if in_transaction(db):
+            row = (await self.get_many([id], db)).get(id)
+        else:
+            row = await self.loader(db).load(id)
+        if row is None:
+            raise self.not_found()
+        return row
+
+    # Keyset pagination ordered by (`order_by`, pk), or pk alone.
+    # `after` is the key returned for the previous page; returns (rows, next key).
+    async def list(
+        self,
+        db: databases.Database,
+        where: Sequence = (),
+        order_by=None,
+        limit: int = 100,
+        after: list | None = None,
+    ):
+        keys = [self.pk] if order_by is None else [order_by, self.pk]
+        labels = [f"sort_key_{i}" for i in range(len(keys))]
+        query = select(
+            *self.columns, *(key.label(label) for key, label in zip(keys, labels))
+        ).where(*where)
+        if after:
+            query = query.where(tuple_(*keys) > tuple_(*after))
+        query = query.order_by(*keys).limit(limit + 1)  # One extra row to detect more
+        rows = await db.fetch_all(query)
+        if len(rows) <= limit:
+            return rows, None
+        last = rows[limit - 1]
+        return rows[:limit], [last[label] for label in labels]
+
+    # Insert one row and return it
+    async def create(self, data: dict, db: databases.Database):
+        query = insert(self.table).values(**data).returning(*self.columns)
+        with self._conflicts():
+            return await db.fetch_one(query)
+
+    # Insert many rows with multi-row INSERTs; all or nothing
+    async def bulk_insert(self, rows: List[dict], db: databases.Database):
+        if not rows:
+            return []
+        inserted = []
+        with self._conflicts():
+            async with db.transaction():
+                for chunk in self._chunks(rows):
+                    query = insert(self.table).values(chunk).returning(*self.columns)
+                    inserted.extend(await db.fetch_all(query))
+        return inserted
+
+    # INSERT ... ON CONFLICT (index_elements) DO UPDATE; returns the written rows.
+    # Updates every supplied column except the conflict target unless `update` is set;
+    # an empty `update` inserts the new rows only (DO NOTHING).
+    async def upsert(
+        self,
+        rows: List[dict],
+        db: databases.Database,
+        index_elements: Sequence[str] = None,
+        update: Sequence[str] = None,
+    ):
+        if not rows:
+            return []
+        index_elements = list(index_elements or [self.pk.name])
+        if update is None:
+            update = [key for key in rows[0] if key not in index_elements]
+        written = []
+        async with db.transaction():
+            for chunk in self._chunks(rows):
+                query = pg_insert(self.table).values(chunk)
+                query = (
+                    query.on_conflict_do_update(
+                        index_elements=index_elements,
+                        set_={key: query.excluded[key] for key in update},
+                    )
+                    if update
+                    else query.on_conflict_do_nothing(index_elements=index_elements)
+                ).returning(*self.columns)
+                written.extend(await db.fetch_all(query))
+        self._invalidate(row[self.pk.name] for row in written)
+        return written
+
+    # Update one row and return it, without a separate existence check
+    async def update(self, id, values: dict, db: databases.Database):
+        if not values:
+            return await self.get(id, db)
+        query = (
+            self.table.update()
+            .where(self.pk == id)
+            .values(**values)
+            .returning(*self.columns)
+        )
+        with self._conflicts():
+            row = await db.fetch_one(query)
+        self._invalidate([id])
+        if row is None:
+            raise self.not_found()
+        return row
+
+    # Apply the same values to many rows; returns the primary keys that were updated
+    async def bulk_update(self, ids: List, values: dict, db: databases.Database):
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return []
+        updated = []
+        with self._conflicts():
+            async with db.transaction():
+                for chunk in self._chunks(ids):
+                    query = (
+                        self.table.update()
+                        .where(self.pk == self._ids_param(chunk))
+                        .values(**values)
+                        .returning(self.pk)
+                    )
+                    updated.extend(self._pks(await db.fetch_all(query)))
+        self._invalidate(ids)
+        return updated
+
+    # Per-row updates, each row a dict with the primary key and the columns to set.
+    # Rows setting the same columns share one UPDATE ... FROM (VALUES ...) per chunk.
+    # Returns the primary keys that were updated.
+    async def bulk_update_rows(self, rows: List[dict], db: databases.Database):
+        merged = {}  # A repeated key would update its row twice in one statement
+        for row in rows:
+            merged.setdefault(row[self.pk.name], {}).update(row)
+        groups = {}
+        for row in merged.values():
+            keys = tuple(sorted(key for key in row if key != self.pk.name))
+            if keys:
+                groups.setdefault(keys, []).append(row)
+        updated = []
+        with self._conflicts():
+            async with db.transaction():
+                for keys, group in groups.items():
+                    for chunk in self._chunks(group):
+                        query = self._update_from_values(keys, chunk)
+                        updated.extend(self._pks(await db.fetch_all(query)))
+        self._invalidate(updated)
+        return updated
+
+    def _update_from_values(self, keys: Sequence[str], rows: List[dict]):
+        columns = [self.pk, *(self.table.c[key] for key in keys)]
+        # Typed binds: untyped parameters in VALUES would be read as text
+        typed_rows = [
+            tuple(cast(literal(row[c.name], c.type), c.type) for c in columns)
+            for row in rows
+        ]
+        data = values_clause(*(column(c.name, c.type) for c in columns), name="data")
+        data = data.data(typed_rows)
+        return (
+            self.table.update()
+            .where(self.pk == data.c[self.pk.name])
+            .values({key: data.c[key] for key in keys})
+            .returning(self.pk)
+        )
+
+    # Update every row matching `where`, a chunk of primary keys at a time.
+    # Returns the primary keys that were updated.
+    async def update_where(self, where: Sequence, values: dict, db: databases.Database):
+        with self._conflicts():
+            updated = await self._chunked_where(
+                where, lambda rows: self.table.update().where(rows).values(**values), db
+            )
+        self._invalidate(updated)
+        return updated
+
+    # Delete one row; 404 when it does not exist
+    async def delete(self, id, db: databases.Database):
+        query = self.table.delete().where(self.pk == id).returning(self.pk)
+        deleted = await db.fetch_one(query)
+        self._invalidate([id])
+        if deleted is None:
+            raise self.not_found()
+        return deleted[self.pk.name]
+
+    # Delete many rows; returns the primary keys that were deleted
+    async def bulk_delete(self, ids: List, db: databases.Database):
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return []
+        deleted = []
+        async with db.transaction():
+            for chunk in self._chunks(ids):
+                query = (
+                    self.table.delete()
+                    .where(self.pk == self._ids_param(chunk))
+                    .returning(self.pk)
+                )
+                deleted.extend(self._pks(await db.fetch_all(query)))
+        self._invalidate(ids)
+        return deleted
+
+    # Delete every row matching `where`, a chunk of primary keys at a time.
+    # Returns the primary keys that were deleted.
+    async def delete_where(self, where: Sequence, db: databases.Database):
+        deleted = await self._chunked_where(
+            where, lambda rows: self.table.delete().where(rows), db
+        )
+        self._invalidate(deleted)
+        return deleted
+
+    # Run `statement(condition)` over the rows matching `where` in pk order, at most
+    # chunk_size rows per statement, all in one transaction. Walking the pk keyset
+    # terminates even when the rows still match `where` after the statement.
+    async def _chunked_where(self, where: Sequence, statement, db: databases.Database):
+        if not where:
+            raise ValueError("A filtered write needs at least one condition")
+        affected = []
+        last = None
+        async with db.transaction():
+            while True:
+                chunk = select(self.pk).where(*where)
+                if last is not None:
+                    chunk = chunk.where(self.pk > last)
+                chunk = chunk.order_by(self.pk).limit(self.chunk_size)
+                query = statement(self.pk.in_(chunk.scalar_subquery()))
+                pks = self._pks(await db.fetch_all(query.returning(self.pk)))
+                affected.extend(pks)
+                if len(pks) < self.chunk_size:
+                    return affected
+                last = max(pks)
+
+    def _pks(self, rows) -> List:
+        return [row[self.pk.name] for row in rows]
@@ -0,0 +1,186 @@
+"""Synthetic users and addresses, bulk loaded with COPY.
+
+Generates `--users` users (0-3 addresses each, 1.5 on average) with realistic, skewed
+distributions: common first/last names, a few large mail providers plus a long tail
+of company domains, 90% active accounts and sign-up dates over the last three years.
+Emails are unique (they embed the user id) and the data is deterministic per --seed
+(apart from address ids, which follow the order the workers finish in).
+
+The id range is split across `--workers` processes that each COPY their share in
+batches. Secondary indexes are dropped for the load and rebuilt afterwards, which
+is much faster than maintaining the trigram/full-text GIN indexes row by row.
+
+    python -m benchmarks.datagen --users 1000000 --database-url postgresql://...
+
+WARNING: the users and addresses tables of the target database are truncated.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import asyncpg
+
+import config
+from migrate import upgrade
+
+FIRST_NAMES = ["james", "mary", "robert", "patricia", "john", "jennifer", "michael", "linda", "david", "elizabeth", "william", "barbara", "richard", "susan", "joseph", "jessica", "thomas", "sarah", "charles", "karen", "christopher", "lisa", "daniel", "nancy", "matthew", "betty", "anthony", "sandra", "mark", "margaret", "donald", "ashley", "steven", "kimberly", "andrew", "emily", "paul", "donna", "joshua", "michelle", "wei", "yan", "aarav", "priya", "mohammed", "fatima", "jose", "maria", "lukas", "sofia"]  # fmt: skip
+LAST_NAMES = ["smith", "johnson", "williams", "brown", "jones", "garcia", "miller", "davis", "rodriguez", "martinez", "hernandez", "lopez", "gonzalez", "wilson", "anderson", "thomas", "taylor", "moore", "jackson", "martin", "lee", "perez", "thompson", "white", "harris", "sanchez", "clark", "ramirez", "lewis", "robinson", "walker", "young", "allen", "king", "wright", "scott", "torres", "nguyen", "hill", "flores", "wang", "li", "zhang", "kumar", "singh", "khan", "muller", "schmidt", "rossi", "silva"]  # fmt: skip
+MAIL_PROVIDERS = ["gmail.com", "yahoo.com", "outlook.com", "hotmail.com", "icloud.com"]
+MAIL_PROVIDER_WEIGHTS = [40, 12, 10, 8, 5]  # Remaining share goes to company domains
+COMPANY_DOMAINS = 5000  # example-<n>.com, picked with a long-tail distribution
+STREET_NAMES = ["Main", "Oak", "Pine", "Maple", "Cedar", "Elm", "Washington", "Lake", "Hill", "Park", "Sunset", "River", "Church", "Mill", "Spring"]  # fmt: skip
+STREET_SUFFIXES = ["St", "Ave", "Rd", "Blvd", "Ln", "Dr", "Ct", "Way"]
+CITIES = ["New York", "Los Angeles", "Chicago", "Houston", "Phoenix", "Philadelphia", "San Antonio", "San Diego", "Dallas", "San Jose", "Austin", "Seattle", "Denver", "Boston", "Portland", "London", "Berlin", "Paris", "Madrid", "Toronto"]  # fmt: skip
+ADDRESS_COUNTS = [0, 1, 2, 3]
+ADDRESS_COUNT_WEIGHTS = [15, 35, 35, 15]  # 1.5 addresses per user on average
+
+COPY_BATCH = 50_000  # Rows generated and sent per COPY
+USER_COLUMNS = ("id", "name", "email", "is_active", "created_at", "updated_at")
+ADDRESS_COLUMNS = ("user_id", "street", "city", "created_at", "updated_at")
+TABLES = ("users", "addresses")
+
+# Indexes that are not backing a constraint (primary keys stay in place)
+SECONDARY_INDEXES_QUERY = """
+SELECT indexname, indexdef FROM pg_indexes
+WHERE schemaname = current_schema() AND tablename = ANY($1::text[])
+  AND indexname NOT IN (SELECT conname FROM pg_constraint)
+"""
+
+
+def asyncpg_url(url: str) -> str:
+    return url.replace("postgresql+asyncpg://", "postgresql://")
+
+
+def company_domain(rng: random.Random) -> str:
+    # paretovariate gives a few big companies and a long tail of small ones
+    return f"example-{int(rng.paretovariate(1.2)) % COMPANY_DOMAINS}.com"
+
+
+def generate_batch(start: int, stop: int, seed: int, now: datetime):
+    """Users with ids in [start, stop) and their addresses."""
+    rng = random.Random(seed * 1_000_003 + start)  # Same rows whatever --workers
+    provider_share = sum(MAIL_PROVIDER_WEIGHTS)
+    users, addresses = [], []
+    for user_id in range(start, stop):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        roll = rng.randrange(100)
+        domain = (
+            rng.choices(MAIL_PROVIDERS, MAIL_PROVIDER_WEIGHTS)[0]
+            if roll < provider_share
+            else company_domain(rng)
+        )
+        created_at = now - timedelta(seconds=rng.randrange(3 * 365 * 24 * 3600))
+        users.append(
+            (
+                user_id,
+                f"{first.title()} {last.title()}",
+                f"{first}.{last}.{user_id}@{domain}",
+                rng.random() < 0.9,
+                created_at,
+                created_at,
+            )
+        )
+        for _ in range(rng.choices(ADDRESS_COUNTS, ADDRESS_COUNT_WEIGHTS)[0]):
+            addresses.append(
+                (
+                    user_id,
+                    f"{rng.randrange(1, 9999)} {rng.choice(STREET_NAMES)} "
+                    f"{rng.choice(STREET_SUFFIXES)}",
+                    rng.choice(CITIES),
+                    created_at,
+                    created_at,
+                )
+            )
+    return users, addresses
+
+
+async def load_range(url: str, start: int, stop: int, seed: int, now: datetime):
+    conn = await asyncpg.connect(asyncpg_url(url))
+    try:
+        for batch_start in range(start, stop, COPY_BATCH):
+            users, addresses = generate_batch(
+                batch_start, min(batch_start + COPY_BATCH, stop), seed, now
+            )
+            await conn.copy_records_to_table(
+                "users", records=users, columns=USER_COLUMNS
+            )
+            await conn.copy_records_to_table(
+                "addresses", records=addresses, columns=ADDRESS_COLUMNS
+            )
+    finally:
+        await conn.close()
+    return stop - start
+
+
+def load_range_process(url: str, start: int, stop: int, seed: int, now: datetime):
+    return asyncio.run(load_range(url, start, stop, seed, now))
+
+
+async def load(url: str, users: int, workers: int = os.cpu_count() or 1, seed: int = 1):
+    """Replace the users and addresses with `users` generated users."""
+    upgrade(url)
+    conn = await asyncpg.connect(asyncpg_url(url))
+    started = time.perf_counter()
+    try:
+        await conn.execute("TRUNCATE users, addresses RESTART IDENTITY CASCADE")
+        indexes = await conn.fetch(SECONDARY_INDEXES_QUERY, list(TABLES))
+        for index in indexes:
+            await conn.execute(f'DROP INDEX "{index["indexname"]}"')
+        try:
+            now = datetime.now(timezone.utc)
+            # Whole COPY batches per worker: batches (and their random seeds) start
+            # at the same ids whatever the number of workers
+            step = -(-users // (workers * COPY_BATCH)) * COPY_BATCH
+            loop = asyncio.get_running_loop()
+            with ProcessPoolExecutor(workers) as pool:
+                await asyncio.gather(
+                    *[
+                        loop.run_in_executor(
+                            pool,
+                            load_range_process,
+                            url,
+                            start,
+                            min(start + step, users + 1),
+                            seed,
+                            now,
+                        )
+                        for start in range(1, users + 1, step)
+                    ]
+                )
+            loaded = time.perf_counter()
+            print(f"Copied {users:,} users in {loaded - started:.1f}s")
+        finally:
+            # Rebuilt even after a failed load, so the schema is never left without them
+            for index in indexes:
+                await conn.execute(index["indexdef"])
+        for table in TABLES:
+            await conn.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"coalesce(max(id), 0) + 1, false) FROM {table}"
+            )
+            await conn.execute(f"ANALYZE {table}")
+        print(
+            f"Rebuilt {len(indexes)} indexes and analyzed in "
+            f"{time.perf_counter() - loaded:.1f}s"
+        )
+    finally:
+        await conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=config.DATABASE_URL)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(load(args.database_url, args.users, args.workers, args.seed))
+
+
+if __name__ == "__main__":
+    main()
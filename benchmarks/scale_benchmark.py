@@ -0,0 +1,281 @@
+"""Scale test: the users/addresses code paths against growing tables.
+
+For each size in `--sizes` the tables are reloaded with benchmarks.datagen, then every
+scenario (reads, list, search, bulk and single updates, bulk create/delete) runs
+`--iterations` times through the repository functions. Per scenario and size it
+records latency (p50/p95/max), the Python allocation peak of one call (tracemalloc)
+and the rows Postgres read with sequential scans (pg_stat_user_tables), and it ends
+with the growth of p50 latency between sizes:
+
+    latency ~ rows ** exponent
+
+Index-backed paths stay close to 0; an exponent towards 1, or sequential-scan reads
+that grow with the table, point at a whole-table scan or another O(n) regression.
+
+    python -m benchmarks.scale_benchmark --sizes 10000,1000000,10000000 \\
+        --database-url postgresql://... --output scale.json
+
+WARNING: the users and addresses tables of the target database are replaced.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import statistics
+import time
+import tracemalloc
+import uuid
+
+import databases
+from sqlalchemy import func
+
+import config
+from benchmarks.datagen import COMPANY_DOMAINS, FIRST_NAMES, LAST_NAMES, load
+from repositories import (
+    attach_addresses_repo,
+    batch_get_user_repo,
+    bulk_create_user_repo,
+    bulk_delete_user_repo,
+    bulk_update_user_repo,
+    get_user_repo,
+    list_user_repo,
+    search_user_repo,
+    update_user_repo,
+    user_repository,
+)
+from schemas import User
+
+EXPONENT_WARNING = 0.5  # Flag scenarios whose latency grows faster than this
+SEQ_SCAN_WARNING = 0.1  # Flag scenarios reading this share of the table per call
+
+# Scenarios by name: async scenario(db, rng, rows); registered with @scenario
+SCENARIOS = {}
+
+
+def scenario(name: str):
+    def decorator(fn):
+        SCENARIOS[name] = fn
+        return fn
+
+    return decorator
+
+
+def tail_domain(rng: random.Random) -> str:
+    return f"example-{rng.randrange(100, COMPANY_DOMAINS)}.com"
+
+
+@scenario("get_user")
+async def get_user(db, rng, rows):
+    await get_user_repo(rng.randint(1, rows), db)
+
+
+@scenario("batch_get_100")
+async def batch_get(db, rng, rows):
+    await batch_get_user_repo([rng.randint(1, rows) for _ in range(100)], db)
+
+
+@scenario("list_by_domain")
+async def list_by_domain(db, rng, rows):
+    await list_user_repo(db, {"email_domain": tail_domain(rng)})
+
+
+@scenario("list_all")
+async def list_all(db, rng, rows):
+    await list_user_repo(db)  # GET /users/ without filters
+
+
+@scenario("list_page_2")
+async def list_page(db, rng, rows):
+    name = func.lower(User.name)
+    _, after = await user_repository.list(db, order_by=name, limit=100)
+    await user_repository.list(db, order_by=name, limit=100, after=after)
+
+
+@scenario("list_with_addresses")
+async def list_with_addresses(db, rng, rows):
+    users = await list_user_repo(db, {"email_domain": tail_domain(rng)}, ["id"])
+    await attach_addresses_repo(users, db)
+
+
+@scenario("search_prefix")
+async def search_prefix(db, rng, rows):
+    await search_user_repo(rng.choice(FIRST_NAMES)[:3], "prefix", 20, None, db)
+
+
+@scenario("search_fulltext")
+async def search_fulltext(db, rng, rows):
+    term = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)[:4]}"
+    await search_user_repo(term, "fulltext", 20, None, db)
+
+
+@scenario("search_fuzzy")
+async def search_fuzzy(db, rng, rows):
+    await search_user_repo(rng.choice(LAST_NAMES)[:-1] + "x", "fuzzy", 20, None, db)
+
+
+@scenario("update_user")
+async def update_user(db, rng, rows):
+    await update_user_repo(rng.randint(1, rows), {"is_active": rng.random() < 0.9}, db)
+
+
+@scenario("bulk_update_1000")
+async def bulk_update(db, rng, rows):
+    ids = rng.sample(range(1, rows + 1), min(1000, rows))
+    users = [{"id": user_id, "is_active": rng.random() < 0.9} for user_id in ids]
+    await bulk_update_user_repo({"users": users}, db)
+
+
+@scenario("bulk_update_filter")
+async def bulk_update_filter(db, rng, rows):
+    data = {"filter": {"email_domain": tail_domain(rng)}, "values": {"is_active": True}}
+    await bulk_update_user_repo(data, db)
+
+
+@scenario("bulk_create_delete_1000")
+async def bulk_create_delete(db, rng, rows):
+    run = uuid.uuid4().hex
+    users = [
+        {"name": f"Scale Test {n}", "email": f"scale.{run}.{n}@example.org"}
+        for n in range(1000)
+    ]
+    created = await bulk_create_user_repo({"users": users}, db)
+    await bulk_delete_user_repo({"ids": [user["id"] for user in created]}, db)
+
+
+async def seq_tuples_read(db: databases.Database) -> int:
+    # Flush this backend's counters (Postgres 15+) and drop the cached snapshot
+    try:
+        await db.execute("SELECT pg_stat_force_next_flush()")
+    except Exception:
+        await asyncio.sleep(0.6)  # Older servers report every 500ms
+    await db.execute("SELECT pg_stat_clear_snapshot()")
+    return await db.fetch_val(
+        "SELECT CAST(coalesce(sum(seq_tup_read), 0) AS bigint) FROM pg_stat_user_tables"
+        " WHERE relname IN ('users', 'addresses')"
+    )
+
+
+async def run_scenario(db, fn, rows, iterations, seed):
+    rng = random.Random(seed)
+    await fn(db, rng, rows)  # Warm-up: connection, plans, caches
+    seq_before = await seq_tuples_read(db)
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await fn(db, rng, rows)
+        samples.append((time.perf_counter() - started) * 1000)
+    seq_per_call = (await seq_tuples_read(db) - seq_before) / iterations
+
+    tracemalloc.start()
+    await fn(db, rng, rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples.sort()
+    return {
+        "p50_ms": statistics.median(samples),
+        "p95_ms": samples[max(0, math.ceil(len(samples) * 0.95) - 1)],
+        "max_ms": samples[-1],
+        "peak_kib": peak / 1024,
+        "seq_rows_per_call": seq_per_call,
+    }
+
+
+async def run_size(args, rows: int):
+    await load(args.database_url, rows, args.workers, args.seed)
+    # One connection, so the statistics flush covers every query of the scenarios
+    db = databases.Database(
+        args.database_url.replace("postgresql+asyncpg://", "postgresql://"),
+        min_size=1,
+        max_size=1,
+    )
+    await db.connect()
+    try:
+        table_bytes = await db.fetch_val(
+            "SELECT pg_total_relation_size('users') + pg_total_relation_size('addresses')"
+        )
+        results = {}
+        print(f"\n{rows:,} users ({table_bytes / 2**20:,.0f} MiB with indexes)")
+        print(
+            f"{'scenario':<26}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"
+            f"{'peak KiB':>10}{'seq rows/call':>15}"
+        )
+        for name in args.scenarios:
+            result = await run_scenario(
+                db, SCENARIOS[name], rows, args.iterations, args.seed
+            )
+            results[name] = result
+            flag = (
+                "  <- sequential scan"
+                if result["seq_rows_per_call"] > SEQ_SCAN_WARNING * rows
+                else ""
+            )
+            print(
+                f"{name:<26}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                f"{result['max_ms']:>9.2f}{result['peak_kib']:>10.0f}"
+                f"{result['seq_rows_per_call']:>15,.0f}{flag}"
+            )
+    finally:
+        await db.disconnect()
+    return {
+        "rows": rows,
+        "table_bytes": table_bytes,
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "scenarios": results,
+    }
+
+
+def print_growth(runs: list):
+    if len(runs) < 2:
+        return
+    print("\nLatency growth (p50 exponent between consecutive sizes)")
+    steps = [f"{a['rows']:,}->{b['rows']:,}" for a, b in zip(runs, runs[1:])]
+    header = "".join(f"{step:>24}" for step in steps)
+    print(f"{'scenario':<26}{header}")
+    for name in runs[0]["scenarios"]:
+        exponents = [
+            math.log(
+                max(b["scenarios"][name]["p50_ms"], 1e-3)
+                / max(a["scenarios"][name]["p50_ms"], 1e-3)
+            )
+            / math.log(b["rows"] / a["rows"])
+            for a, b in zip(runs, runs[1:])
+        ]
+        flag = "  <- grows with table size" if max(exponents) > EXPONENT_WARNING else ""
+        print(f"{name:<26}{''.join(f'{e:>24.2f}' for e in exponents)}{flag}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=config.DATABASE_URL)
+    parser.add_argument("--sizes", default="10000,1000000,10000000")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"comma-separated subset of: {', '.join(SCENARIOS)}",
+    )
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    runs = []
+    for rows in sorted(int(size) for size in args.sizes.split(",")):
+        runs.append(await run_size(args, rows))
+    print_growth(runs)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(runs, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+"""Benchmark for GET /users/search/ on a synthetic users table.
+
+Seeds `--rows` users with generate_series (after applying the migrations, which
+create the search indexes), then times search_user_repo for every search mode.
+
+    python -m benchmarks.search_benchmark --rows 3000000 --database-url postgresql://...
+
+WARNING: the users table of the target database is truncated before seeding.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import databases
+
+import config
+from migrate import upgrade
+
+FIRST_NAMES = ["james", "mary", "robert", "patricia", "john", "jennifer", "michael", "linda", "david", "elizabeth", "william", "barbara", "richard", "susan", "joseph", "jessica", "thomas", "sarah", "charles", "karen"]  # fmt: skip
+LAST_NAMES = ["smith", "johnson", "williams", "brown", "jones", "garcia", "miller", "davis", "rodriguez", "martinez", "hernandez", "lopez", "gonzalez", "wilson", "anderson", "thomas", "taylor", "moore", "jackson", "martin"]  # fmt: skip
+
+SEED_CHUNK = 500_000
+
+# Each user gets a first/last name pair plus a numeric suffix so names stay diverse
+SEED_QUERY = """
+INSERT INTO users (name, email, is_active, created_at, updated_at)
+SELECT
+    initcap(first[1 + g % array_length(first, 1)]) || ' '
+        || initcap(last[1 + (g / 20) % array_length(last, 1)]) || ' ' || g,
+    first[1 + g % array_length(first, 1)] || '.' || g || '@example'
+        || (g % 97) || '.com',
+    g % 10 <> 0,
+    now(),
+    now()
+FROM generate_series(CAST(:start AS int), CAST(:stop AS int)) AS g,
+     (SELECT CAST(:first_names AS text[]) AS first,
+             CAST(:last_names AS text[]) AS last) AS names
+"""
+
+
+def sync_url(url: str) -> str:
+    return url.replace("postgresql+asyncpg://", "postgresql://")
+
+
+async def seed(db: databases.Database, rows: int):
+    await db.execute("TRUNCATE users RESTART IDENTITY CASCADE")
+    started = time.perf_counter()
+    for start in range(1, rows + 1, SEED_CHUNK):
+        await db.execute(
+            SEED_QUERY,
+            {
+                "start": start,
+                "stop": min(start + SEED_CHUNK - 1, rows),
+                "first_names": FIRST_NAMES,
+                "last_names": LAST_NAMES,
+            },
+        )
+    await db.execute("ANALYZE users")
+    print(f"Seeded {rows:,} users in {time.perf_counter() - started:.1f}s")
+
+
+def search_terms(mode: str) -> list:
+    if mode == "prefix":
+        return [name[:3] for name in FIRST_NAMES] + [f"{n}.1" for n in FIRST_NAMES]
+    if mode == "fuzzy":
+        return [name[:-1] + "x" for name in LAST_NAMES]
+    return [f"{first} {last[:4]}" for first, last in zip(FIRST_NAMES, LAST_NAMES[::-1])]
+
+
+async def run(db: databases.Database, iterations: int, limit: int):
+    from repositories import search_user_repo
+
+    for mode in ("prefix", "fulltext", "fuzzy"):
+        terms = search_terms(mode)
+        first_page, next_page = [], []
+        for _ in range(iterations):
+            term = random.choice(terms)
+            started = time.perf_counter()
+            _, after = await search_user_repo(term, mode, limit, None, db)
+            first_page.append((time.perf_counter() - started) * 1000)
+            if after:
+                started = time.perf_counter()
+                await search_user_repo(term, mode, limit, after, db)
+                next_page.append((time.perf_counter() - started) * 1000)
+        for label, samples in (("page 1", first_page), ("page 2", next_page)):
+            if samples:
+                samples.sort()
+                print(
+                    f"{mode:<9} {label}: p50={statistics.median(samples):7.2f}ms "
+                    f"p95={samples[int(len(samples) * 0.95) - 1]:7.2f}ms "
+                    f"max={samples[-1]:7.2f}ms (n={len(samples)})"
+                )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--database-url", default=config.DATABASE_URL)
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    upgrade(args.database_url)
+    db = databases.Database(sync_url(args.database_url))
+    await db.connect()
+    try:
+        if not args.skip_seed:
+            await seed(db, args.rows)
+        await run(db, args.iterations, args.limit)
+    finally:
+        await db.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""Startup benchmark: time from process start until the app answers GET /.
+
+Each run starts a fresh `uvicorn main:app` process, polls / until it responds, then
+sends SIGTERM and times the shutdown. The database must be reachable and migrated
+(`python migrate.py`); startup runs no DDL.
+
+    python -m benchmarks.startup_benchmark --runs 10
+"""
+
+import argparse
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+POLL_INTERVAL = 0.005  # seconds
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return True
+        except urllib.error.HTTPError:  # Any response, even a 404, means it is serving
+            return True
+        except OSError:  # Refused, reset or timed out while workers start
+            time.sleep(POLL_INTERVAL)
+    return False
+
+
+def run_once(port: int, timeout: float):
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)]
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not wait_until_ready(f"http://127.0.0.1:{port}/", process, timeout):
+            raise RuntimeError("Server did not become ready; is the database up?")
+        ready = time.perf_counter() - started
+        stopping = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=timeout)
+        return ready, time.perf_counter() - stopping
+    finally:
+        if process.poll() is None:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app startup time.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    startups, shutdowns = [], []
+    for _ in range(args.runs):
+        ready, stopped = run_once(args.port, args.timeout)
+        startups.append(ready * 1000)
+        shutdowns.append(stopped * 1000)
+    for label, samples in (("startup", startups), ("shutdown", shutdowns)):
+        print(
+            f"{label:<8}: min={min(samples):7.1f}ms "
+            f"median={statistics.median(samples):7.1f}ms "
+            f"max={max(samples):7.1f}ms (n={len(samples)})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+"""main:app without rate limits, for load tests driven from a single address.
+
+Every benchmark connection comes from 127.0.0.1, so the per-client buckets would
+soon answer 429 and the benchmark would time the limiter. The middleware stays in
+place (its per-request cost is part of the app) but no rule matches.
+"""
+
+from starlette.middleware import Middleware
+
+from main import app
+from middleware import RateLimitMiddleware
+
+app.user_middleware = [
+    Middleware(RateLimitMiddleware, rules=()) if m.cls is RateLimitMiddleware else m
+    for m in app.user_middleware
+]
@@ -0,0 +1,137 @@
+"""Throughput scaling benchmark for server.py: requests/s with 1..N workers.
+
+For each worker count, starts `python server.py --workers W`, waits until it answers,
+then drives it with keep-alive HTTP/1.1 clients spread over several processes (so the
+load generator is not the bottleneck) and reports requests/s and scaling efficiency.
+Only 2xx responses count; any others are reported next to the rate.
+
+    python -m benchmarks.throughput_benchmark --max-workers 8 --path /users/1/
+
+The database must be up and migrated (the app connects on startup). The default
+app is benchmarks.throughput_app, main:app without rate limits: all the load comes
+from one address and would otherwise be answered with 429s.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.startup_benchmark import wait_until_ready
+
+
+# Returns (2xx responses, other responses)
+async def _client(host: str, port: int, path: str, deadline: float):
+    reader, writer = await asyncio.open_connection(host, port)
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+    ok = failed = 0
+    try:
+        while time.perf_counter() < deadline:
+            writer.write(request)
+            headers = await reader.readuntil(b"\r\n\r\n")
+            status = int(headers.split(b" ", 2)[1])
+            length = 0
+            for line in headers.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            await reader.readexactly(length)
+            if 200 <= status < 300:
+                ok += 1
+            else:
+                failed += 1
+    finally:
+        writer.close()
+    return ok, failed
+
+
+def _load_process(host, port, path, connections, duration, results):
+    async def run():
+        deadline = time.perf_counter() + duration
+        counts = await asyncio.gather(
+            *[_client(host, port, path, deadline) for _ in range(connections)],
+            return_exceptions=True,
+        )
+        counts = [count for count in counts if isinstance(count, tuple)]
+        return sum(ok for ok, _ in counts), sum(failed for _, failed in counts)
+
+    results.put(asyncio.run(run()))
+
+
+# Returns (2xx responses/s, other responses/s)
+def measure(args, workers: int):
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "server.py",
+            args.app,
+            "--workers",
+            str(workers),
+            "--port",
+            str(args.port),
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        url = f"http://127.0.0.1:{args.port}/"
+        if not wait_until_ready(url, server, timeout=30):
+            raise RuntimeError("Server did not become ready")
+        time.sleep(1)  # Let every worker finish its startup
+        results = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(
+                target=_load_process,
+                args=(
+                    "127.0.0.1",
+                    args.port,
+                    args.path,
+                    args.connections // args.client_processes,
+                    args.duration,
+                    results,
+                ),
+            )
+            for _ in range(args.client_processes)
+        ]
+        for client in clients:
+            client.start()
+        counts = [results.get() for _ in clients]
+        for client in clients:
+            client.join()
+        return (
+            sum(ok for ok, _ in counts) / args.duration,
+            sum(failed for _, failed in counts) / args.duration,
+        )
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure throughput scaling.")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--app", default="benchmarks.throughput_app:app")
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--connections", type=int, default=256)
+    parser.add_argument("--client-processes", type=int, default=4)
+    args = parser.parse_args()
+
+    counts = sorted({1, *range(2, args.max_workers + 1, 2), args.max_workers})
+    baseline = None
+    for workers in counts:
+        rate, failed = measure(args, workers)
+        baseline = baseline or rate
+        print(
+            f"workers={workers:<3} {rate:10.0f} req/s  "
+            f"speedup={rate / baseline:5.2f}x  "
+            f"efficiency={rate / baseline / workers:6.1%}"
+            + (f"  non-2xx={failed:.0f}/s" if failed else "")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark of the WebSocket message protocols (ws_protocol.py).
+
+For a few representative messages, reports per-message encode and decode time and
+the payload bytes on the wire for JSON and MessagePack, then the cost of a broadcast
+to `--recipients` connections when every recipient encodes the message itself (the
+old send_json path) versus encoding once per protocol.
+
+    python -m benchmarks.ws_protocol_benchmark --recipients 10000
+"""
+
+import argparse
+import json
+import time
+import timeit
+
+from ws_protocol import PROTOCOLS
+
+
+def user(i: int) -> dict:
+    return {
+        "id": i,
+        "name": f"User Number {i}",
+        "email": f"user{i}@example.com",
+        "isActive": i % 10 != 0,
+        "addresses": [
+            {
+                "id": i * 2 + n,
+                "userId": i,
+                "street": f"{n} Main St",
+                "city": "Springfield",
+            }
+            for n in range(2)
+        ],
+    }
+
+
+MESSAGES = {
+    "ack": {"type": "response", "message": "Message received"},
+    "broadcast": {"type": "broadcast", "message": "This is a broadcast message"},
+    "user": {"type": "user.updated", "data": user(1)},
+    "user_list_50": {"type": "users", "data": [user(i) for i in range(50)]},
+}
+
+
+def per_call(fn, number: int) -> float:
+    """Best per-call time in microseconds over a few repeats."""
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def wire_size(frame) -> int:
+    return len(frame.encode() if isinstance(frame, str) else frame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=5_000)
+    parser.add_argument("--recipients", type=int, default=10_000)
+    args = parser.parse_args()
+
+    if "msgpack" not in PROTOCOLS:
+        print("msgpack is not installed; only JSON will be measured")
+
+    print(
+        f"{'message':<14}{'protocol':<10}{'bytes':>8}{'encode µs':>12}{'decode µs':>12}"
+    )
+    for name, message in MESSAGES.items():
+        for protocol in PROTOCOLS.values():
+            frame = protocol.encode(message)
+            # Decode what a client would send: JSON text arrives as UTF-8 bytes too
+            raw = frame.encode() if isinstance(frame, str) else frame
+            decode = protocol.decode if protocol.binary else json.loads
+            print(
+                f"{name:<14}{protocol.name:<10}{wire_size(frame):>8}"
+                f"{per_call(lambda: protocol.encode(message), args.number):>12.2f}"
+                f"{per_call(lambda: decode(raw), args.number):>12.2f}"
+            )
+
+    message = MESSAGES["user"]
+    print(f"\nBroadcast of 'user' to {args.recipients} recipients (encode only)")
+    for protocol in PROTOCOLS.values():
+        started = time.perf_counter()
+        for _ in range(args.recipients):
+            protocol.encode(message)
+        per_recipient = time.perf_counter() - started
+        started = time.perf_counter()
+        frame = protocol.encode(message)
+        frames = [frame] * args.recipients  # What broadcast() hands to the sends
+        once = time.perf_counter() - started
+        print(
+            f"{protocol.name:<10}per recipient {per_recipient * 1000:8.2f} ms   "
+            f"encode once {once * 1000:8.3f} ms   "
+            f"bytes sent {wire_size(frame) * len(frames):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
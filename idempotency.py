@@ -0,0 +1,251 @@
+# Idempotency keys for retried writes (`Idempotency-Key` header).
+# The first request with a key runs normally and its response is stored for
+# IDEMPOTENCY_TTL; retries with the same key get the stored response without running
+# the endpoint, and duplicates arriving while it runs wait for its result.
+# Responses live in process by default; RedisIdempotencyStore shares them across
+# workers.
+import asyncio
+import hashlib
+import json
+import re
+import secrets
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+
+from starlette.exceptions import HTTPException
+
+from config import IDEMPOTENCY_REDIS_URL
+from logger_setup import logger
+
+IDEMPOTENCY_HEADER = "idempotency-key"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_TTL = 24 * 60 * 60  # seconds a stored response is replayed
+IDEMPOTENCY_WAIT_TIMEOUT = 30  # seconds a duplicate waits for the first request
+IDEMPOTENCY_METHODS = frozenset(("POST",))
+IDEMPOTENCY_PATHS = re.compile(r"/users/(bulk/)?$")  # Create and bulk create
+
+
+class StoredResponse:
+    __slots__ = ("status_code", "body", "media_type", "fingerprint")
+
+    def __init__(self, status_code: int, body: bytes, media_type: str, fingerprint):
+        self.status_code = status_code
+        self.body = body
+        self.media_type = media_type
+        self.fingerprint = fingerprint
+
+    def dumps(self) -> bytes:
+        return json.dumps(
+            [self.status_code, self.body.decode(), self.media_type, self.fingerprint],
+            separators=(",", ":"),
+        ).encode()
+
+    @classmethod
+    def loads(cls, data: bytes) -> "StoredResponse":
+        status_code, body, media_type, fingerprint = json.loads(data)
+        return cls(status_code, body.encode(), media_type, fingerprint)
+
+
+# Hash of the request a key was first used with; a key reused for a different
+# request is rejected instead of replaying an unrelated response
+def request_fingerprint(method: str, path: str, body: bytes) -> str:
+    digest = hashlib.sha256(f"{method} {path}\n".encode())
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def check_fingerprint(stored: StoredResponse, fingerprint: str):
+    if stored.fingerprint != fingerprint:
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request",
+        )
+
+
+def still_running() -> HTTPException:
+    return HTTPException(
+        status_code=HTTPStatus.CONFLICT,
+        detail="A request with this Idempotency-Key is still in progress",
+    )
+
+
+class InMemoryIdempotencyStore:
+    def __init__(self, ttl: int = IDEMPOTENCY_TTL, max_entries: int = 100_000):
+        """Stored responses are kept in completion order. Every entry has the same
+        TTL, so the oldest entries expire first and eviction only looks at the
+        front of the dict."""
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._responses: OrderedDict[str, tuple] = OrderedDict()  # (expires, resp)
+        self._running: dict[str, asyncio.Future] = {}
+
+    async def begin(
+        self, key: str, fingerprint: str, timeout: float = IDEMPOTENCY_WAIT_TIMEOUT
+    ) -> StoredResponse | None:
+        """Returns the stored response for `key`, or None when the caller should
+        run the request and then call complete() or release()."""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._evict()
+            entry = self._responses.get(key)
+            if entry is not None:
+                check_fingerprint(entry[1], fingerprint)
+                return entry[1]
+            running = self._running.get(key)
+            if running is None:
+                self._running[key] = asyncio.get_running_loop().create_future()
+                return None
+            # Wait for the first request; if it is released without a response,
+            # loop and take over
+            try:
+                await asyncio.wait_for(
+                    asyncio.shield(running), deadline - time.monotonic()
+                )
+            except asyncio.TimeoutError:
+                raise still_running()
+
+    async def complete(self, key: str, response: StoredResponse):
+        self._responses[key] = (time.monotonic() + self.ttl, response)
+        self._responses.move_to_end(key)
+        while len(self._responses) > self.max_entries:
+            self._responses.popitem(last=False)
+        self._finish(key)
+
+    async def release(self, key: str):
+        """Forget a request that produced no storable response."""
+        self._finish(key)
+
+    def _finish(self, key: str):
+        running = self._running.pop(key, None)
+        if running is not None and not running.done():
+            running.set_result(None)
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._responses:
+            key, (expires, _) = next(iter(self._responses.items()))
+            if expires > now:
+                break
+            del self._responses[key]
+
+
+_PENDING = b"pending:"  # Placeholder of a running request, followed by its owner token
+
+# The scripts below act only while the key still holds the caller's placeholder
+# (ARGV[1]), so a request whose placeholder expired cannot touch a key that another
+# request has claimed since
+_REDIS_REFRESH = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Also stores the response when the placeholder expired and nobody claimed the key
+_REDIS_COMPLETE = """
+local current = redis.call('GET', KEYS[1])
+if current == ARGV[1] or not current then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+_REDIS_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisIdempotencyStore:
+    def __init__(
+        self,
+        redis,
+        prefix: str = "idempotency:",
+        ttl: int = IDEMPOTENCY_TTL,
+        poll_interval: float = 0.05,
+        lease_ttl: int = IDEMPOTENCY_WAIT_TIMEOUT,
+    ):
+        """`redis` is a `redis.asyncio.Redis` client (or fakeredis). A running
+        request holds its key with a placeholder carrying a unique owner token; it
+        expires after `lease_ttl` seconds unless the owner refreshes it, which it
+        does every third of that while the request runs. So a crashed worker blocks
+        the key for at most `lease_ttl`, however long requests take. Other workers
+        poll the key."""
+        self._redis = redis
+        self._refresh = redis.register_script(_REDIS_REFRESH)
+        self._complete = redis.register_script(_REDIS_COMPLETE)
+        self._release = redis.register_script(_REDIS_RELEASE)
+        self._prefix = prefix
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.lease_ttl = lease_ttl
+        # (key, task) -> (placeholder, refresh task). A key is claimed again in this
+        # process only once its placeholder expired; the task that called begin()
+        # tells the two requests apart.
+        self._leases = {}
+
+    async def begin(
+        self, key: str, fingerprint: str, timeout: float = IDEMPOTENCY_WAIT_TIMEOUT
+    ) -> StoredResponse | None:
+        name = self._prefix + key
+        deadline = time.monotonic() + timeout
+        while True:
+            placeholder = _PENDING + secrets.token_hex(16).encode()
+            if await self._redis.set(name, placeholder, nx=True, ex=self.lease_ttl):
+                refresh = asyncio.create_task(self._keep_alive(name, placeholder))
+                self._leases[key, asyncio.current_task()] = (placeholder, refresh)
+                return None
+            data = await self._redis.get(name)
+            if data is not None and not data.startswith(_PENDING):
+                stored = StoredResponse.loads(data)
+                check_fingerprint(stored, fingerprint)
+                return stored
+            if time.monotonic() >= deadline:
+                raise still_running()
+            await asyncio.sleep(self.poll_interval)
+
+    async def complete(self, key: str, response: StoredResponse):
+        placeholder = self._end_lease(key)
+        stored = await self._complete(
+            keys=[self._prefix + key], args=[placeholder, response.dumps(), self.ttl]
+        )
+        if not stored:
+            logger.warning(f"Idempotency key was claimed by another request: {key}")
+
+    async def release(self, key: str):
+        placeholder = self._end_lease(key)
+        await self._release(keys=[self._prefix + key], args=[placeholder])
+
+    async def _keep_alive(self, name: str, placeholder: bytes):
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                if not await self._refresh(
+                    keys=[name], args=[placeholder, self.lease_ttl]
+                ):
+                    return  # Expired or taken over; complete() will not store
+            except Exception as e:  # Retried at the next interval
+                logger.error(f"Failed to refresh idempotency key {name}: {e}")
+
+    def _end_lease(self, key: str) -> bytes:
+        placeholder, refresh = self._leases.pop(
+            (key, asyncio.current_task()), (b"", None)
+        )
+        if refresh is not None:
+            refresh.cancel()
+        return placeholder
+
+
+def create_idempotency_store():
+    if IDEMPOTENCY_REDIS_URL:
+        from redis.asyncio import Redis  # Optional dependency
+
+        return RedisIdempotencyStore(Redis.from_url(IDEMPOTENCY_REDIS_URL))
+    return InMemoryIdempotencyStore()
+
+
+idempotency_store = create_idempotency_store()
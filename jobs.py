@@ -0,0 +1,262 @@
+# Background job queue backed by the `jobs` table.
+# Jobs are claimed with FOR UPDATE SKIP LOCKED, so several workers (and processes)
+# can share the queue without handing the same job out twice.
+import asyncio
+from datetime import timedelta
+from http import HTTPStatus
+from typing import Awaitable, Callable, Dict
+
+import databases
+from asyncpg.exceptions import IntegrityConstraintViolationError
+from sqlalchemy import and_, func, insert, or_, select, update
+from starlette.exceptions import HTTPException
+
+from logger_setup import logger
+from repositories import bulk_create_user_repo
+from schemas import Job
+
+JOB_WORKER_CONCURRENCY = 2  # Jobs processed at the same time per process
+JOB_POLL_INTERVAL = 1.0  # seconds between queue polls when idle
+JOB_LEASE = timedelta(minutes=5)  # A running job is requeued once its lease expires
+JOB_HEARTBEAT_INTERVAL = JOB_LEASE.total_seconds() / 3  # Lease renewal while running
+JOB_DRAIN_TIMEOUT = 30  # seconds to let running jobs finish on shutdown
+JOB_RETRY_BACKOFF = 2  # seconds, doubled after each failed attempt
+
+JOB_COLUMNS = (
+    Job.id,
+    Job.kind,
+    Job.status,
+    Job.attempts,
+    Job.max_attempts,
+    Job.result,
+    Job.error,
+    Job.created_at,
+    Job.updated_at,
+)
+
+# Job handlers by kind: async handler(payload, db) -> JSON-serializable result
+JOB_HANDLERS: Dict[str, Callable[[dict, databases.Database], Awaitable]] = {}
+
+
+def register_job(kind: str):
+    def decorator(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+
+    return decorator
+
+
+# Queue a job and wake up an idle worker
+async def enqueue_job(
+    kind: str, payload: dict, db: databases.Database, max_attempts: int = 3
+):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    query = (
+        insert(Job)
+        .values(kind=kind, payload=payload, max_attempts=max_attempts)
+        .returning(*JOB_COLUMNS)
+    )
+    job = await db.fetch_one(query)
+    job_worker.notify()
+    return job
+
+
+# Read Job
+async def get_job_repo(job_id: int, db: databases.Database):
+    job = await db.fetch_one(select(*JOB_COLUMNS).where(Job.id == job_id))
+    if not job:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Job not found")
+    return job
+
+
+class JobWorker:
+    def __init__(
+        self,
+        concurrency: int = JOB_WORKER_CONCURRENCY,
+        poll_interval: float = JOB_POLL_INTERVAL,
+    ):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.db = None
+        self.tasks = []
+        self._stopping = asyncio.Event()
+        self._wakeup = asyncio.Event()
+
+    async def start(self, db: databases.Database):
+        """Start the worker tasks; call once the database is connected."""
+        self.db = db
+        self._stopping.clear()
+        self.tasks = [
+            asyncio.create_task(self._run(worker_id))
+            for worker_id in range(self.concurrency)
+        ]
+        logger.info(f"Started {self.concurrency} background job workers")
+
+    async def stop(self, timeout: float = JOB_DRAIN_TIMEOUT):
+        """Stop claiming new jobs and wait for running ones to finish."""
+        self._stopping.set()
+        self._wakeup.set()
+        if not self.tasks:
+            return
+        _, pending = await asyncio.wait(self.tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()  # Its job is requeued when the lease expires
+        await asyncio.gather(*pending, return_exceptions=True)
+        self.tasks = []
+        logger.info(
+            f"Background job workers stopped ({len(pending)} cancelled while running)"
+        )
+
+    def notify(self):
+        """Wake up idle workers instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    async def _run(self, worker_id: int):
+        while not self._stopping.is_set():
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} failed to claim a job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job)
+
+    async def _claim(self):
+        now = func.now()
+        await self._fail_expired()
+        next_job = (
+            select(Job.id)
+            .where(
+                or_(
+                    and_(Job.status == "queued", Job.run_at <= now),
+                    # Its worker died (or was cancelled on shutdown) mid-job
+                    and_(
+                        Job.status == "running",
+                        Job.locked_until < now,
+                        Job.attempts < Job.max_attempts,
+                    ),
+                )
+            )
+            .order_by(Job.run_at, Job.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        query = (
+            update(Job)
+            .where(Job.id == next_job)
+            .values(
+                status="running",
+                attempts=Job.attempts + 1,
+                locked_until=now + JOB_LEASE,
+            )
+            .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts)
+        )
+        return await self.db.fetch_one(query)
+
+    async def _fail_expired(self):
+        """Fail jobs whose lease expired on their last attempt instead of handing
+        them out again: a job that kills its worker (e.g. out of memory) would
+        otherwise be retried forever."""
+        query = (
+            update(Job)
+            .where(
+                Job.status == "running",
+                Job.locked_until < func.now(),
+                Job.attempts >= Job.max_attempts,
+            )
+            .values(
+                status="failed",
+                locked_until=None,
+                error="Lease expired on the last attempt (worker lost)",
+            )
+        )
+        await self.db.execute(query)
+
+    def _owned(self, job):
+        """UPDATE of `job` that only matches while this worker still holds it:
+        a job reclaimed after its lease expired has a higher attempt count."""
+        return update(Job).where(
+            Job.id == job["id"],
+            Job.status == "running",
+            Job.attempts == job["attempts"],
+        )
+
+    async def _heartbeat(self, job):
+        """Renew the lease while the handler runs, so a long job is not handed to
+        another worker."""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+            try:
+                await self.db.execute(
+                    self._owned(job).values(locked_until=func.now() + JOB_LEASE)
+                )
+            except Exception as e:
+                logger.error(f"Failed to renew the lease of job {job['id']}: {e}")
+
+    async def _run_handler(self, handler, job):
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            return await handler(job["payload"], self.db)
+        finally:
+            heartbeat.cancel()
+
+    async def _execute(self, job):
+        handler = JOB_HANDLERS.get(job["kind"])
+        try:
+            if handler is None:
+                raise HTTPException(
+                    status_code=HTTPStatus.NOT_IMPLEMENTED,
+                    detail=f"No handler for job kind {job['kind']}",
+                )
+            result = await self._run_handler(handler, job)
+        except HTTPException as e:
+            # Client errors (e.g. duplicate users) will not succeed on retry
+            await self._finish(job, status="failed", error=str(e.detail))
+        except IntegrityConstraintViolationError as e:
+            # Constraint violations a handler did not translate; permanent as well
+            await self._finish(job, status="failed", error=str(e))
+        except Exception as e:
+            logger.error(f"Job {job['id']} ({job['kind']}) failed: {e}")
+            if job["attempts"] < job["max_attempts"]:
+                delay = timedelta(
+                    seconds=JOB_RETRY_BACKOFF * 2 ** (job["attempts"] - 1)
+                )
+                await self._finish(
+                    job, status="queued", error=str(e), run_at=func.now() + delay
+                )
+            else:
+                await self._finish(job, status="failed", error=str(e))
+        else:
+            await self._finish(job, status="succeeded", result=result)
+
+    async def _finish(self, job, **values):
+        # No-op if the job was reclaimed by another worker in the meantime
+        await self.db.execute(self._owned(job).values(locked_until=None, **values))
+
+
+job_worker = JobWorker()
+
+
+# Job handlers
+
+BULK_CREATE_CHUNK_SIZE = 1000  # Rows per INSERT, keeps statements and locks small
+
+
+@register_job("users.bulk_create")
+async def bulk_create_users_job(payload: dict, db: databases.Database):
+    users = payload["users"]
+    inserted = 0
+    # One transaction for the whole job, so a retry never sees a partial import
+    async with db.transaction():
+        for start in range(0, len(users), BULK_CREATE_CHUNK_SIZE):
+            chunk = users[start : start + BULK_CREATE_CHUNK_SIZE]
+            inserted += len(await bulk_create_user_repo({"users": chunk}, db))
+    return {"inserted": inserted}
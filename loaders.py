@@ -0,0 +1,156 @@
+# DataLoader-style batching: every load() issued during the same event-loop
+# iteration is collected and resolved with one call to the batch function.
+# Repository.loader() in base_repository.py gives every model one per database.
+# WriteBatcher does the same for writes, collecting them over a short time window.
+# Batches run in their own task, on their own pool connection: callers inside a
+# transaction must bypass them (see in_transaction) to see their own writes.
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+from weakref import WeakKeyDictionary, ref
+
+import databases
+
+from logger_setup import logger
+
+
+def in_transaction(db) -> bool:
+    """Whether the current task has a transaction open on `db` (a Database or a
+    Connection). `databases` binds connections to tasks, so a query run from a
+    batch task would use another connection and miss the uncommitted writes, or wait
+    for a second connection while the caller holds the first.
+    Reads private attributes of `databases`, which is pinned to 0.9.x for this."""
+    if isinstance(db, databases.Database):
+        if db._global_connection is None and not db._connection_map.get(
+            asyncio.current_task()
+        ):
+            return False  # No connection on this task yet, so no transaction
+        db = db.connection()
+    return bool(db._transaction_stack)
+
+
+class BatchLoader:
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+        max_batch_size: int = 1000,
+    ):
+        """`batch_fn` receives a list of keys and returns a mapping of key -> value.
+        Keys missing from the mapping resolve to None."""
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[Hashable, List[asyncio.Future]] = {}
+        self._scheduled = False
+        self._tasks = set()  # Strong references so in-flight batches are not GC'd
+
+    async def load(self, key: Hashable):
+        """Queue a key for the current tick and wait for its batched result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+        if not self._scheduled:
+            self._scheduled = True
+            # Runs after every coroutine already queued for this tick has called load()
+            loop.call_soon(self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        self._scheduled = False
+        keys = list(pending)
+        for start in range(0, len(keys), self.max_batch_size):
+            chunk = {
+                key: pending[key] for key in keys[start : start + self.max_batch_size]
+            }
+            task = asyncio.ensure_future(self._resolve(chunk))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, pending: Dict[Hashable, List[asyncio.Future]]):
+        try:
+            results = await self.batch_fn(list(pending))
+        except Exception as e:
+            logger.error(f"Batch load of {len(pending)} keys failed: {e}")
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for key, futures in pending.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(results.get(key))
+
+
+class WriteBatcher:
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_delay: float = 0.002,
+        max_batch_size: int = 500,
+    ):
+        """Write-behind batching: items submitted within `max_delay` seconds (or until
+        `max_batch_size` items) are written with one call to `flush_fn`, which returns
+        one result per item. A result that is an exception is raised to its caller."""
+        self.flush_fn = flush_fn
+        self.max_delay = max_delay
+        self.max_batch_size = max_batch_size
+        self._items: List[Any] = []
+        self._futures: List[asyncio.Future] = []
+        self._timer = None
+        self._tasks = set()  # Strong references so in-flight flushes are not GC'd
+
+    async def submit(self, item):
+        """Queue an item for the next flush and wait for its own result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._items.append(item)
+        self._futures.append(future)
+        if len(self._items) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, futures = self._items, self._futures
+        self._items, self._futures = [], []
+        if items:
+            task = asyncio.ensure_future(self._write(items, futures))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, items: List[Any], futures: List[asyncio.Future]):
+        try:
+            results = await self.flush_fn(items)
+        except Exception as e:
+            logger.error(f"Batched write of {len(items)} items failed: {e}")
+            results = [e] * len(items)
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+# One user create batcher per database, created lazily on first use
+_user_create_batchers: "WeakKeyDictionary[databases.Database, WriteBatcher]" = (
+    WeakKeyDictionary()
+)
+
+
+def get_user_create_batcher(db: databases.Database) -> WriteBatcher:
+    batcher = _user_create_batchers.get(db)
+    if batcher is None:
+        # Imported here to avoid a circular import with repositories
+        from repositories import create_users_batch_repo
+
+        # Weak reference: the dict value must not keep its key alive
+        db_ref = ref(db)
+        batcher = WriteBatcher(lambda rows: create_users_batch_repo(rows, db_ref()))
+        _user_create_batchers[db] = batcher
+    return batcher
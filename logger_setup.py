@@ -11,12 +11,15 @@ error_log_file = os.path.join(log_folder, "error/error.log")
 
 logs_files = [info_log_file, warning_log_file, error_log_file]
 
-# Check if the log files exist and create them if they don't exist
-for log_file in logs_files:
-    os.makedirs(os.path.dirname(log_file), exist_ok=True)
-    if not os.path.exists(log_file):
-        with open(log_file, "w") as f:
-            pass
+
+# Check if the log files exist and create them if they don't exist.
+# Called when the logger starts, so importing this module touches no files.
+def ensure_log_files():
+    for log_file in logs_files:
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        if not os.path.exists(log_file):
+            with open(log_file, "w") as f:
+                pass
 
 
 # Custom filter to filter log records based on severity level
@@ -51,6 +54,7 @@ def create_timed_rotating_handler(
 
 # Helper coroutine to setup and manage the logger
 async def init_logger():
+    ensure_log_files()
     # Create handlers for each level using the reusable function
     info_handler = create_timed_rotating_handler(info_log_file, logging.INFO, formatter)
     warning_handler = create_timed_rotating_handler(
@@ -96,6 +100,9 @@ async def init_logger():
         listener.stop()
 
 
-# Initialize the logger
-log_task = asyncio.create_task(init_logger())
+# Start the file logger; called from the app lifespan instead of at import time
+def start_logger() -> asyncio.Task:
+    return asyncio.create_task(init_logger())
+
+
 logger = logging.getLogger()
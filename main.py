@@ -1,20 +1,29 @@
 from asyncio import ensure_future
 import contextlib
-from logger_setup import logger
+from http import HTTPStatus
+from logger_setup import logger, start_logger
 
+from pydantic import ValidationError
 from starlette.applications import Starlette
 from starlette.exceptions import HTTPException
 from starlette.middleware import Middleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
-from starlette.routing import Mount
+from starlette.routing import Mount, Route
 
-from config import database, engine
-from middleware import DBSessionMiddleware
-from routes import user
+from config import DATABASE_POOL_MIN_SIZE, database
+from middleware import (
+    AdmissionControlMiddleware,
+    DBSessionMiddleware,
+    IdempotencyMiddleware,
+    RateLimitMiddleware,
+)
+from jobs import job_worker
+from migrate import check_migrations
+from routes import address, job, user
 from routes.websocket import test as ws_test
-from schemas import Base
-from ws_connection import periodic_heartbeat
+from repositories import warm_up_repo
+from ws_connection import connection_manager, periodic_heartbeat
 
 
 async def http_exception(request: Request, exc: HTTPException):
@@ -23,36 +32,67 @@ async def http_exception(request: Request, exc: HTTPException):
     )
 
 
+# Request bodies and query strings that fail model validation are client errors
+async def validation_exception(request: Request, exc: ValidationError):
+    return JSONResponse(
+        {
+            "detail": exc.errors(
+                include_url=False, include_context=False, include_input=False
+            )
+        },
+        status_code=HTTPStatus.BAD_REQUEST,
+    )
+
+
 @contextlib.asynccontextmanager
 async def lifespan(app):
+    log_task = start_logger()
     await database.connect()
     logger.info("Connected to database")
-    async with engine.begin() as conn:
-        # Bind the models to the engine
-        await conn.run_sync(Base.metadata.create_all)
-        logger.info("Created tables")
+    # The schema is managed by versioned migrations (`python migrate.py`), applied
+    # out of band, so startup and shutdown run no DDL.
+    await check_migrations(database)
+    await warm_up_repo(database, DATABASE_POOL_MIN_SIZE)
+    logger.info("Warmed up database connections")
 
-    # Add the heartbeat task on startup
+    # Add the heartbeat and cleanup tasks on startup
     ensure_future(periodic_heartbeat())
+    connection_manager.start()
+    await job_worker.start(database)
     yield
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
-        logger.info("Dropped tables")
+    await connection_manager.drain()
+    await job_worker.stop()
     await database.disconnect()
     logger.info("Disconnected from database")
+    log_task.cancel()
+
+
+async def homepage(request):
+    return JSONResponse({"hello": "world"})
 
 
 def _init_routes():
     return [
+        # Before the Mount("/") below, which would otherwise shadow it
+        Route("/", homepage),
         Mount("/users", routes=user.routes),
+        Mount("/addresses", routes=address.routes),
+        Mount("/jobs", routes=job.routes),
         Mount("/", routes=ws_test.routes),
     ]
 
 
-exception_handlers = {HTTPException: http_exception}
+exception_handlers = {
+    HTTPException: http_exception,
+    ValidationError: validation_exception,
+}
 app = Starlette(
     debug=True,
     middleware=[
+        Middleware(RateLimitMiddleware),
+        # Before admission control, so replayed responses never wait for a slot
+        Middleware(IdempotencyMiddleware),
+        Middleware(AdmissionControlMiddleware),
         Middleware(DBSessionMiddleware),
     ],
     lifespan=lifespan,
@@ -61,10 +101,5 @@ app = Starlette(
 )
 
 
-@app.route("/")
-async def homepage(request):
-    return JSONResponse({"hello": "world"})
-
-
 # if __name__ == "__main__":
 #     uvicorn.run("main:app", host="0.0.0.0", port=8000)
@@ -1,10 +1,144 @@
+import math
+import time
+from http import HTTPStatus
 from logger_setup import logger
 from typing import Awaitable, Callable
 
+from starlette.exceptions import HTTPException
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
 
+from admission import AdmissionController, AdmissionRejected
 from config import database
+from idempotency import (
+    IDEMPOTENCY_HEADER,
+    IDEMPOTENCY_KEY_MAX_LENGTH,
+    IDEMPOTENCY_METHODS,
+    IDEMPOTENCY_PATHS,
+    StoredResponse,
+    idempotency_store,
+    request_fingerprint,
+)
+from ratelimit import DEFAULT_RATE_LIMIT_RULES, client_key, rate_limit_store
+
+
+class RateLimitMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, rules=DEFAULT_RATE_LIMIT_RULES, store=None):
+        super().__init__(app)
+        self.rules = rules
+        self.store = store or rate_limit_store
+
+    async def dispatch(
+        self, request: Request, call_next: Callable[[Request], Awaitable]
+    ):
+        method, path = request.method, request.url.path
+        for rule in self.rules:
+            if rule.matches(method, path):
+                break
+        else:
+            return await call_next(request)
+        client = client_key(request)
+        retry_after = await self.store.consume(f"{rule.name}:{client}", rule)
+        if retry_after:
+            logger.warning(f"Rate limited {client} on {rule.name}: {request.url}")
+            return JSONResponse(
+                {"detail": "Rate limit exceeded."},
+                status_code=HTTPStatus.TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+        return await call_next(request)
+
+
+class IdempotencyMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, store=None):
+        super().__init__(app)
+        self.store = store or idempotency_store
+
+    async def dispatch(
+        self, request: Request, call_next: Callable[[Request], Awaitable]
+    ):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if (
+            key is None
+            or request.method not in IDEMPOTENCY_METHODS
+            or not IDEMPOTENCY_PATHS.match(request.url.path)
+        ):
+            return await call_next(request)
+        if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return JSONResponse(
+                {"detail": "Invalid Idempotency-Key."},
+                status_code=HTTPStatus.BAD_REQUEST,
+            )
+        # Keys are per client, so clients cannot replay each other's responses
+        key = f"{client_key(request)}:{key}"
+        fingerprint = request_fingerprint(
+            request.method,
+            f"{request.url.path}?{request.url.query}",
+            await request.body(),
+        )
+        try:
+            stored = await self.store.begin(key, fingerprint)
+        except HTTPException as e:
+            return JSONResponse({"detail": e.detail}, status_code=e.status_code)
+        if stored is not None:
+            logger.info(f"Replayed response for idempotent request: {request.url}")
+            return Response(
+                stored.body,
+                status_code=stored.status_code,
+                media_type=stored.media_type,
+                headers={"Idempotent-Replayed": "true"},
+            )
+
+        try:
+            response = await call_next(request)
+            if response.status_code >= 500:
+                # Not a result of the request itself; let a retry run it again
+                await self.store.release(key)
+                return response
+            body = b"".join([chunk async for chunk in response.body_iterator])
+        except BaseException:
+            await self.store.release(key)
+            raise
+        await self.store.complete(
+            key,
+            StoredResponse(
+                response.status_code,
+                body,
+                response.headers.get("content-type"),
+                fingerprint,
+            ),
+        )
+        return Response(
+            body, status_code=response.status_code, headers=dict(response.headers)
+        )
+
+
+class AdmissionControlMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, controller: AdmissionController = None):
+        super().__init__(app)
+        self.controller = controller or AdmissionController()
+
+    async def dispatch(
+        self, request: Request, call_next: Callable[[Request], Awaitable]
+    ):
+        rule = self.controller.match(request.method, request.url.path)
+        if rule is None:
+            return await call_next(request)
+        try:
+            await self.controller.acquire(rule)
+        except AdmissionRejected as e:
+            logger.warning(f"Rejected {rule.name} request {request.url}: overloaded")
+            return JSONResponse(
+                {"detail": "Server is overloaded, please retry later."},
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        started = time.perf_counter()
+        try:
+            return await call_next(request)
+        finally:
+            self.controller.release(rule, time.perf_counter() - started)
 
 
 class DBSessionMiddleware(BaseHTTPMiddleware):
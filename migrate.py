@@ -0,0 +1,112 @@
+"""Apply the versioned SQL migrations in migrations/ (NNNN_name.sql, in order).
+
+Run out of band, before starting or rolling the app servers:
+
+    python migrate.py           # apply pending migrations
+    python migrate.py --status  # list applied and pending migrations
+
+Applied versions are recorded in the schema_migrations table. An advisory lock
+keeps concurrent runs (e.g. several deploy jobs) from applying a migration twice.
+"""
+
+import argparse
+import re
+from pathlib import Path
+
+import databases
+from sqlalchemy import create_engine, text
+
+from config import DATABASE_URL
+from logger_setup import logger
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+MIGRATION_LOCK_ID = 7_270_001  # pg_advisory_xact_lock key shared by all runs
+
+
+def available_migrations():
+    """[(version, path)] of the migration files, oldest first."""
+    migrations = []
+    for path in MIGRATIONS_DIR.glob("*.sql"):
+        match = re.match(r"^(\d+)_", path.name)
+        if match:
+            migrations.append((int(match.group(1)), path))
+    return sorted(migrations)
+
+
+def sync_database_url(url: str = DATABASE_URL) -> str:
+    return url.replace("postgresql+asyncpg://", "postgresql+psycopg2://")
+
+
+def _applied_versions(conn):
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            " version INTEGER PRIMARY KEY,"
+            " name VARCHAR NOT NULL,"
+            " applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now())"
+        )
+    )
+    return set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+
+def upgrade(url: str = DATABASE_URL):
+    """Apply every pending migration in one transaction (Postgres DDL is transactional)."""
+    engine = create_engine(sync_database_url(url))
+    try:
+        with engine.begin() as conn:
+            conn.execute(
+                text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID}
+            )
+            applied = _applied_versions(conn)
+            for version, path in available_migrations():
+                if version in applied:
+                    continue
+                logger.info(f"Applying migration {path.name}")
+                conn.exec_driver_sql(path.read_text())
+                conn.execute(
+                    text(
+                        "INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"
+                    ),
+                    {"v": version, "n": path.name},
+                )
+    finally:
+        engine.dispose()
+
+
+def status(url: str = DATABASE_URL):
+    engine = create_engine(sync_database_url(url))
+    try:
+        with engine.begin() as conn:
+            applied = _applied_versions(conn)
+    finally:
+        engine.dispose()
+    for version, path in available_migrations():
+        print(f"{'applied' if version in applied else 'pending'}  {path.name}")
+
+
+# Startup check: one cheap query instead of DDL; warns rather than blocking startup
+async def check_migrations(db: databases.Database):
+    latest = max((version for version, _ in available_migrations()), default=0)
+    try:
+        current = await db.fetch_val("SELECT max(version) FROM schema_migrations")
+    except Exception as e:
+        logger.warning(
+            f"Could not read schema_migrations ({e}); run `python migrate.py`"
+        )
+        return
+    if (current or 0) < latest:
+        logger.warning(
+            f"Database schema is at version {current}, latest is {latest}; "
+            "run `python migrate.py`"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply database migrations.")
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    parser.add_argument("--status", action="store_true", help="only show status")
+    args = parser.parse_args()
+    if args.status:
+        status(args.database_url)
+    else:
+        upgrade(args.database_url)
@@ -0,0 +1,51 @@
+-- Initial schema, matching schemas.py. IF NOT EXISTS lets databases that were
+-- created by the old create_all() on startup adopt the migration history as is.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL NOT NULL,
+    name VARCHAR NOT NULL,
+    email VARCHAR NOT NULL,
+    is_active BOOLEAN,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_user_email ON users (email);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email);
+CREATE INDEX IF NOT EXISTS ix_users_id ON users (id);
+CREATE INDEX IF NOT EXISTS ix_users_name_lower ON users (lower(name));
+CREATE INDEX IF NOT EXISTS ix_users_name_trgm ON users USING gin (lower(name) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_users_email_trgm ON users USING gin (lower(email) gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_users_search ON users
+    USING gin (to_tsvector('simple'::regconfig, name || ' ' || email));
+
+CREATE TABLE IF NOT EXISTS addresses (
+    id SERIAL NOT NULL,
+    user_id INTEGER NOT NULL,
+    street VARCHAR NOT NULL,
+    city VARCHAR NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (id),
+    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS ix_addresses_id ON addresses (id);
+CREATE INDEX IF NOT EXISTS ix_addresses_user_id ON addresses (user_id);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL NOT NULL,
+    kind VARCHAR NOT NULL,
+    payload JSONB NOT NULL,
+    status VARCHAR DEFAULT 'queued' NOT NULL,
+    attempts INTEGER DEFAULT '0' NOT NULL,
+    max_attempts INTEGER DEFAULT '3' NOT NULL,
+    run_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+    locked_until TIMESTAMP WITH TIME ZONE,
+    result JSONB,
+    error VARCHAR,
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    PRIMARY KEY (id)
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at);
@@ -0,0 +1,5 @@
+-- Prefix search (GET /users/search/?mode=prefix), matching schemas.py: byte-order
+-- ("C") keys, so a prefix is an index range scan whatever the database collation
+-- and the name index also returns the matches in page order.
+CREATE INDEX IF NOT EXISTS ix_users_name_prefix ON users ((lower(name) COLLATE "C"), id);
+CREATE INDEX IF NOT EXISTS ix_users_email_prefix ON users ((lower(email) COLLATE "C"));
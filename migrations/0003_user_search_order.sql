@@ -0,0 +1,12 @@
+-- Search pages read in index order, matching schemas.py.
+-- Fuzzy search: GiST trigram indexes return the nearest rows first (ORDER BY <->),
+-- so a page reads its rows instead of ranking every match. The GIN index on
+-- lower(email) stays for the email_domain LIKE filter.
+DROP INDEX IF EXISTS ix_users_name_trgm;
+CREATE INDEX IF NOT EXISTS ix_users_name_trgm_gist ON users USING gist (lower(name) gist_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_users_email_trgm_gist ON users USING gist (lower(email) gist_trgm_ops);
+
+-- Prefix search: email matches are paged by (email, id), so the email index
+-- returns them in page order like the name index does.
+DROP INDEX IF EXISTS ix_users_email_prefix;
+CREATE INDEX IF NOT EXISTS ix_users_email_prefix ON users ((lower(email) COLLATE "C"), id);
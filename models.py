@@ -1,9 +1,13 @@
 # Pydantic Models for request validation
-from typing import List
-from pydantic import BaseModel, Field, ConfigDict
+from typing import Annotated, List, Literal
+from pydantic import BaseModel, Field, ConfigDict, field_validator, model_validator
 from pydantic.alias_generators import to_camel
 
 
+# Primary keys are Postgres `integer` (int4); a larger id would fail in the driver
+UserId = Annotated[int, Field(ge=-(2**31), le=2**31 - 1)]
+
+
 class UserCreateModel(BaseModel):
     model_config = ConfigDict(
         extra="forbid",
@@ -22,3 +26,101 @@ class UserUpdateModel(BaseModel):
 
 class BulkCreateUserModel(BaseModel):
     users: List[UserCreateModel]
+
+
+# Upper bound on IDs accepted by a single batch lookup
+MAX_BATCH_GET_IDS = 1000
+
+
+class BatchGetUserModel(BaseModel):
+    ids: List[UserId] = Field(min_length=1, max_length=MAX_BATCH_GET_IDS)
+
+
+class AddressCreateModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    street: str
+    city: str
+
+
+class UserSearchQueryModel(BaseModel):
+    q: str = Field(min_length=1, max_length=200)
+    mode: Literal["prefix", "fulltext", "fuzzy"] = "fulltext"
+    limit: int = Field(default=20, ge=1, le=100)
+    after: str | None = None  # Cursor from the previous page
+
+
+# User fields a client may request with `fields=` (sparse fieldsets)
+USER_FIELDS = ("id", "name", "email", "is_active")
+
+
+class UserListQueryModel(BaseModel):
+    is_active: bool | None = None
+    email_domain: str | None = Field(default=None, min_length=1, max_length=255)
+    fields: List[str] | None = None
+
+    @field_validator("fields", mode="before")
+    def split_fields(cls, v):
+        if isinstance(v, str):
+            v = [field.strip() for field in v.split(",") if field.strip()]
+        unknown = set(v or ()) - set(USER_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return v or None
+
+
+# Upper bound on users touched by one bulk update/delete given as an ID list
+MAX_BULK_WRITE_IDS = 50_000
+
+
+class UserFilterModel(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    is_active: bool | None = None
+    email_domain: str | None = Field(default=None, min_length=1, max_length=255)
+
+    @model_validator(mode="after")
+    def require_condition(self):
+        # An empty filter would match every user
+        if self.is_active is None and self.email_domain is None:
+            raise ValueError("filter needs at least one condition")
+        return self
+
+
+class BulkUpdateUserItemModel(UserUpdateModel):
+    id: UserId
+
+
+# Either per-user values (`users`), or the same `values` for `ids` or a `filter`
+class BulkUpdateUserModel(BaseModel):
+    users: List[BulkUpdateUserItemModel] | None = Field(
+        default=None, min_length=1, max_length=MAX_BULK_WRITE_IDS
+    )
+    ids: List[UserId] | None = Field(
+        default=None, min_length=1, max_length=MAX_BULK_WRITE_IDS
+    )
+    filter: UserFilterModel | None = None
+    values: UserUpdateModel | None = None
+
+    @model_validator(mode="after")
+    def check_target(self):
+        targets = [self.users, self.ids, self.filter]
+        if sum(target is not None for target in targets) != 1:
+            raise ValueError("give exactly one of users, ids or filter")
+        if self.users is not None:
+            if self.values is not None:
+                raise ValueError("values cannot be combined with users")
+        elif self.values is None or not self.values.model_fields_set:
+            raise ValueError("values must set at least one field")
+        return self
+
+
+class BulkDeleteUserModel(BaseModel):
+    ids: List[UserId] | None = Field(
+        default=None, min_length=1, max_length=MAX_BULK_WRITE_IDS
+    )
+    filter: UserFilterModel | None = None
+
+    @model_validator(mode="after")
+    def check_target(self):
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("give exactly one of ids or filter")
+        return self
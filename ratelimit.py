@@ -0,0 +1,155 @@
+# Token-bucket rate limiting, per client and per route.
+# Buckets live in an in-process store by default; RedisTokenBucketStore shares them
+# across workers so a limit holds for the whole deployment.
+import math
+import re
+import time
+from typing import Iterable, Pattern
+
+from starlette.requests import HTTPConnection
+
+from config import RATE_LIMIT_REDIS_URL
+
+
+class RateLimitRule:
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        methods: Iterable[str] = None,
+        path: str = None,
+    ):
+        """Allow `rate` requests per second per client, with bursts up to `burst`.
+        A rule without `methods`/`path` matches every request."""
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.methods = frozenset(methods) if methods else None
+        self.path: Pattern | None = re.compile(path) if path else None
+        # A bucket idle this long is full again, so it can be dropped
+        self.ttl = math.ceil(burst / rate) + 1
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.methods is None or method in self.methods) and (
+            self.path is None or self.path.match(path) is not None
+        )
+
+
+# First matching rule wins
+DEFAULT_RATE_LIMIT_RULES = (
+    RateLimitRule(
+        "bulk",
+        rate=0.5,
+        burst=5,
+        methods=("POST", "PATCH", "DELETE"),
+        path=r"/users/bulk/",
+    ),
+    RateLimitRule("broadcast", rate=1, burst=5, path=r"/broadcast/"),
+    RateLimitRule("default", rate=50, burst=100),
+)
+
+# Messages a single WebSocket connection may send
+WS_MESSAGE_RATE_LIMIT = RateLimitRule("ws_message", rate=10, burst=20)
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "ttl")
+
+    def __init__(self, tokens: float, updated: float, ttl: int):
+        self.tokens = tokens
+        self.updated = updated
+        self.ttl = ttl
+
+
+class InMemoryTokenBucketStore:
+    def __init__(self, shards: int = 64, sweep_interval: float = 1.0):
+        """Buckets are spread over `shards` dicts. Every `sweep_interval` seconds one
+        shard is swept for expired buckets, so expiry never walks every client at
+        once."""
+        self._shards = [{} for _ in range(shards)]
+        self._sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._next_shard = 0
+
+    async def consume(self, key: str, rule: RateLimitRule) -> float:
+        """Take a token; returns 0 if allowed, else seconds until one is available."""
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        shard = self._shards[hash(key) % len(self._shards)]
+        bucket = shard.get(key)
+        if bucket is None:
+            bucket = shard[key] = _Bucket(rule.burst, now, rule.ttl)
+        else:
+            # Refill in place; no allocation once the client has a bucket
+            bucket.tokens = min(
+                rule.burst, bucket.tokens + (now - bucket.updated) * rule.rate
+            )
+            bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return 0.0
+        return (1 - bucket.tokens) / rule.rate
+
+    def _sweep(self, now: float):
+        shard = self._shards[self._next_shard]
+        expired = [key for key, b in shard.items() if now - b.updated > b.ttl]
+        for key in expired:
+            del shard[key]
+        self._next_shard = (self._next_shard + 1) % len(self._shards)
+        self._next_sweep = now + self._sweep_interval
+
+
+# Refill and take a token atomically; the server clock keeps workers consistent
+_REDIS_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + (now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return tostring(wait)
+"""
+
+
+class RedisTokenBucketStore:
+    def __init__(self, redis, prefix: str = "ratelimit:"):
+        """`redis` is a `redis.asyncio.Redis` client (or any client with the same
+        `register_script` API, such as fakeredis for local runs)."""
+        self._script = redis.register_script(_REDIS_TOKEN_BUCKET)
+        self._prefix = prefix
+
+    async def consume(self, key: str, rule: RateLimitRule) -> float:
+        wait = await self._script(
+            keys=[self._prefix + key], args=[rule.rate, rule.burst, rule.ttl]
+        )
+        return float(wait)
+
+
+# Identify clients by peer address. Nothing authenticates request headers (such as
+# an API key), so keying on one would let a client reset its limit, and add a
+# bucket, with every new value it sends.
+def client_key(connection: HTTPConnection) -> str:
+    return "ip:" + (connection.client.host if connection.client else "unknown")
+
+
+def create_rate_limit_store():
+    if RATE_LIMIT_REDIS_URL:
+        from redis.asyncio import Redis  # Optional dependency
+
+        return RedisTokenBucketStore(Redis.from_url(RATE_LIMIT_REDIS_URL))
+    return InMemoryTokenBucketStore()
+
+
+rate_limit_store = create_rate_limit_store()
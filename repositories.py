@@ -1,22 +1,96 @@
 # CRUD operations with advanced transaction handling, including exception management.
+import asyncio
+import re
 from http import HTTPStatus
+from typing import List
 import databases
-from sqlalchemy import desc, func, insert, update
-from sqlalchemy.exc import IntegrityError
+from asyncpg.exceptions import (
+    ForeignKeyViolationError,
+    IntegrityConstraintViolationError,
+)
+from sqlalchemy import (
+    Float,
+    Integer,
+    and_,
+    any_,
+    bindparam,
+    desc,
+    func,
+    insert,
+    literal,
+    not_,
+    or_,
+    select,
+    tuple_,
+    union,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
 from starlette.exceptions import HTTPException
 
-from schemas import User
+from base_repository import Repository
+from config import BATCH_USER_CREATES
+from loaders import get_user_create_batcher, in_transaction
+from models import USER_FIELDS
+from schemas import (
+    USER_NAME_PREFIX_KEY,
+    USER_EMAIL_PREFIX_KEY,
+    USER_SEARCH_CONFIG,
+    USER_SEARCH_VECTOR,
+    Address,
+    User,
+)
 
 
-# List Users
-async def list_user_repo(db: databases.Database):
-    query = User.__table__.select().order_by(func.lower(User.name).asc())
+user_repository = Repository(
+    User, conflict_detail="User with this email already exists"
+)
+
+
+# Single array bind parameter for `column = ANY(:name)` lookups
+def _id_array_param(name: str, ids: List[int]):
+    return any_(bindparam(name, list(ids), type_=ARRAY(Integer)))
+
+
+# Escape LIKE wildcards in user input (Postgres' default escape is backslash)
+def _escape_like(value: str) -> str:
+    return re.sub(r"([\\%_])", r"\\\1", value)
+
+
+# SQL conditions for the user list filters (is_active, email_domain)
+def _user_filter_conditions(filters: dict):
+    conditions = []
+    if filters.get("is_active") is not None:
+        conditions.append(User.is_active == filters["is_active"])
+    if filters.get("email_domain"):
+        # Leading-wildcard LIKE is served by the trigram index on lower(email)
+        domain = _escape_like(filters["email_domain"].lower().lstrip("@"))
+        conditions.append(func.lower(User.email).like(f"%@{domain}"))
+    return conditions
+
+
+# User columns to select for a sparse fieldset (every API field when None)
+def _user_columns(fields: List[str] | None):
+    return [User.__table__.c[field] for field in fields or USER_FIELDS]
+
+
+# List Users, filtered and narrowed to the requested columns in SQL
+async def list_user_repo(
+    db: databases.Database, filters: dict = None, fields: List[str] = None
+):
+    query = (
+        select(*_user_columns(fields))
+        .where(*_user_filter_conditions(filters or {}))
+        .order_by(func.lower(User.name).asc())
+    )
     users = await db.fetch_all(query)
     return users
 
 
 # Create User with Transaction Management
 async def create_user_repo(data, db: databases.Database):
+    # The batched INSERT runs in its own task, outside the caller's transaction
+    if BATCH_USER_CREATES and not in_transaction(db):
+        return await get_user_create_batcher(db).submit(data)
     query = (
         insert(User)
         .values(**data)
@@ -30,7 +104,7 @@ async def create_user_repo(data, db: databases.Database):
 
     try:
         user = await db.fetch_one(query)
-    except IntegrityError as e:
+    except IntegrityConstraintViolationError:  # Raised by asyncpg, not SQLAlchemy
         raise HTTPException(
             status_code=400, detail="User with this email already exists"
         )
@@ -38,44 +112,241 @@ async def create_user_repo(data, db: databases.Database):
         return user
 
 
-# Read User
-async def get_user_repo(user_id: int, db: databases.Database):
-    query = User.__table__.select().where(User.id == user_id)
-    user = await db.fetch_one(query)
-    if not user:
-        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="User not found")
-    return user
-
-
-# Update User with Transactions and Exception Handling
-async def update_user_repo(user_id: int, update_data: dict, db: databases.Database):
-    await get_user_repo(user_id, db)
+# Create many single-user requests with one INSERT ... ON CONFLICT DO NOTHING.
+# Returns one entry per row: the created user, or the HTTPException for that row.
+async def create_users_batch_repo(rows: List[dict], db: databases.Database):
     query = (
-        update(User)
-        .where(User.id == user_id)
-        .values(**update_data)
+        pg_insert(User)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[User.email])
         .returning(
             User.id,
             User.name,
             User.email,
             User.is_active,
         )
-    )  # Select columns you want to return
-    await db.execute(query)
+    )
+    created = {user["email"]: user for user in await db.fetch_all(query)}
+    results = []
+    for row in rows:
+        # pop(): a second request for the same email in the batch is a conflict too
+        user = created.pop(row["email"], None)
+        results.append(
+            user
+            if user is not None
+            else HTTPException(
+                status_code=400, detail="User with this email already exists"
+            )
+        )
+    return results
+
+
+# Read User
+async def get_user_repo(user_id: int, db: databases.Database):
+    # Lookups issued in the same event-loop tick share one batched query
+    return await user_repository.get(user_id, db)
+
+
+# Batch Read Users in a single round-trip (WHERE id = ANY(:ids))
+async def get_users_by_ids_repo(user_ids: List[int], db: databases.Database):
+    return await user_repository.get_many(user_ids, db)
+
+
+# Batch Read Users, keeping request order with a not-found marker per ID
+async def batch_get_user_repo(user_ids: List[int], db: databases.Database):
+    users = await get_users_by_ids_repo(user_ids, db)
+    return [
+        {
+            "id": user_id,
+            "found": user_id in users,
+            "user": dict(users[user_id]) if user_id in users else None,
+        }
+        for user_id in user_ids
+    ]
+
+
+INT4_RANGE = range(-(2**31), 2**31)
+
+
+# Whether `after` is a cursor the search `mode` can bind: [side, email or name, id]
+# for prefix (text without NUL), [rank or distance, id] otherwise, with an int4 id.
+# Anything else would only fail in Postgres with a DataError.
+def _valid_search_cursor(after: list, mode: str) -> bool:
+    if mode == "prefix":
+        if len(after) != 3 or after[0] not in ("name", "email"):
+            return False
+        sort_key, user_id = after[1:]
+        valid_key = isinstance(sort_key, str) and "\x00" not in sort_key
+    else:
+        if len(after) != 2:
+            return False
+        sort_key, user_id = after
+        valid_key = isinstance(sort_key, (int, float)) and not isinstance(
+            sort_key, bool
+        )
+    return (
+        valid_key
+        and isinstance(user_id, int)
+        and not isinstance(user_id, bool)
+        and user_id in INT4_RANGE
+    )
+
+
+# Smallest string above every string that starts with `prefix`, in code point order
+# (the "C" collation on UTF-8): `prefix` with its last character incremented
+def _prefix_upper_bound(prefix: str) -> str | None:
+    while prefix:
+        code = ord(prefix[-1]) + 1
+        if 0xD800 <= code <= 0xDFFF:
+            code = 0xE000  # Surrogates cannot be encoded
+        if code <= 0x10FFFF:
+            return prefix[:-1] + chr(code)
+        prefix = prefix[:-1]
+    return None
+
+
+# Prefix search: users whose name starts with `term` ordered by name, then the
+# others whose email starts with it ordered by email. Each side is a range scan on
+# its byte-order index in page order, and the email side only runs once the name
+# matches run out, so a page reads about the rows it returns.
+async def _prefix_search(
+    term: str, limit: int, after: list | None, db: databases.Database
+):
+    upper = _prefix_upper_bound(term)
+
+    def starts_with(key):
+        return and_(key >= term, key < upper) if upper is not None else key >= term
+
+    def side(name, key, condition, after, limit):
+        query = select(
+            *User.__table__.columns,
+            literal(name).label("side"),
+            key.label("sort_key"),
+        ).where(condition)
+        if after:
+            query = query.where(tuple_(key, User.id) > tuple_(*after))
+        return query.order_by(key, User.id).limit(limit)
+
+    side_name, after = (after[0], after[1:]) if after else ("name", None)
+    users = []
+    if side_name == "name":
+        name_matches = starts_with(USER_NAME_PREFIX_KEY)
+        query = side("name", USER_NAME_PREFIX_KEY, name_matches, after, limit + 1)
+        users = await db.fetch_all(query)
+        after = None
+    if len(users) <= limit:
+        email_only = and_(
+            starts_with(USER_EMAIL_PREFIX_KEY),
+            not_(starts_with(USER_NAME_PREFIX_KEY)),
+        )
+        query = side(
+            "email", USER_EMAIL_PREFIX_KEY, email_only, after, limit + 1 - len(users)
+        )
+        users += await db.fetch_all(query)
+    return users
+
 
-    # Ensure changes are committed before returning user
-    updated_user = await get_user_repo(user_id, db)
-    return updated_user
+# Fuzzy search: names or emails similar to `term`, most similar first. Each side is
+# a nearest-first walk of its GiST trigram index (ORDER BY <->) limited before the
+# UNION, so the page is not ranked out of every match.
+def _fuzzy_search_query(term: str, limit: int, after: list | None):
+    name, email = func.lower(User.name), func.lower(User.email)
+
+    def distance_to(key):
+        return key.op("<->", return_type=Float)(term)
+
+    distance = func.least(distance_to(name), distance_to(email), type_=Float)
+
+    def nearest(key):
+        query = select(*User.__table__.columns, distance.label("distance")).where(
+            key.bool_op("%")(term)
+        )
+        if after:
+            query = query.where(tuple_(distance, User.id) > tuple_(*after))
+        return query.order_by(distance_to(key), User.id).limit(limit + 1)
+
+    page = union(nearest(name), nearest(email)).subquery()
+    return (
+        select(page, (1 - page.c.distance).label("rank"))
+        .order_by(page.c.distance, page.c.id)
+        .limit(limit + 1)
+    )
+
+
+# Search Users by name or email with keyset pagination.
+# `after` holds the sort keys of the last row of the previous page.
+# Returns the page and the sort keys to continue from, or None on the last page.
+async def search_user_repo(
+    term: str, mode: str, limit: int, after: list | None, db: databases.Database
+):
+    if after is not None and not _valid_search_cursor(after, mode):
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Invalid cursor")
+    term = term.lower()
+    if mode == "prefix":
+        # Ordered alphabetically (by code point) for autocomplete
+        users = await _prefix_search(term, limit, after, db)
+        cursor_keys = ("side", "sort_key", "id")
+    elif mode == "fuzzy":
+        users = await db.fetch_all(_fuzzy_search_query(term, limit, after))
+        cursor_keys = ("distance", "id")
+    else:  # fulltext
+        words = re.findall(r"\w+", term)
+        if not words:
+            return [], None
+        ts_query = func.to_tsquery(
+            USER_SEARCH_CONFIG, " & ".join(f"{word}:*" for word in words)
+        )
+        rank = func.ts_rank(USER_SEARCH_VECTOR, ts_query)
+        query = select(*User.__table__.columns, rank.label("rank")).where(
+            USER_SEARCH_VECTOR.bool_op("@@")(ts_query)
+        )
+        if after:
+            query = query.where(
+                or_(rank < after[0], and_(rank == after[0], User.id > after[1]))
+            )
+        # One extra row to detect more
+        query = query.order_by(desc(rank), User.id.asc()).limit(limit + 1)
+        users = await db.fetch_all(query)
+        cursor_keys = ("rank", "id")
+
+    if len(users) <= limit:
+        return users, None
+    last = users[limit - 1]
+    return users[:limit], [last[key] for key in cursor_keys]
+
+
+# Update User with one UPDATE ... RETURNING (404 when no row matched)
+async def update_user_repo(user_id: int, update_data: dict, db: databases.Database):
+    return await user_repository.update(user_id, update_data, db)
 
 
 # Delete User (with cascading delete of addresses)
 async def delete_user_repo(user_id: int, db: databases.Database):
-    await get_user_repo(user_id, db)
-    query = User.__table__.delete().where(User.id == user_id)
-    await db.execute(query)
+    await user_repository.delete(user_id, db)
     return {"message": "User deleted"}
 
 
+# Bulk Update Users: per-user values, or the same values for an ID list or a filter.
+# Runs in bounded chunks inside one transaction; returns the updated user IDs.
+async def bulk_update_user_repo(data: dict, db: databases.Database):
+    if data.get("users") is not None:
+        return await user_repository.bulk_update_rows(data["users"], db)
+    if data.get("ids") is not None:
+        return await user_repository.bulk_update(data["ids"], data["values"], db)
+    conditions = _user_filter_conditions(data["filter"])
+    return await user_repository.update_where(conditions, data["values"], db)
+
+
+# Bulk Delete Users by ID list or filter; returns the deleted user IDs.
+# Addresses go with them through the ON DELETE CASCADE on addresses.user_id,
+# which the index on that column keeps cheap for set-based deletes.
+async def bulk_delete_user_repo(data: dict, db: databases.Database):
+    if data.get("ids") is not None:
+        return await user_repository.bulk_delete(data["ids"], db)
+    conditions = _user_filter_conditions(data["filter"])
+    return await user_repository.delete_where(conditions, db)
+
+
 # Bulk Create Users with Transactions and Exception Handling
 
 
@@ -97,10 +368,114 @@ async def bulk_create_user_repo(data, db: databases.Database):
     try:
         # Fetch the inserted records (including auto-generated ids)
         inserted_users = await db.fetch_all(query)
-    except IntegrityError as e:
+    except IntegrityConstraintViolationError:  # Raised by asyncpg, not SQLAlchemy
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST, detail="One or more users already exist"
         )
     else:
         # Return the list of inserted users
         return inserted_users
+
+
+# Address columns returned to clients
+ADDRESS_COLUMNS = (Address.id, Address.user_id, Address.street, Address.city)
+
+address_repository = Repository(Address, columns=ADDRESS_COLUMNS)
+
+
+# Batch Read Addresses for many users in one query (selectin-style IN load)
+async def get_addresses_by_user_ids_repo(user_ids: List[int], db: databases.Database):
+    addresses = {user_id: [] for user_id in user_ids}
+    if not addresses:
+        return addresses
+    query = (
+        select(*ADDRESS_COLUMNS)
+        .where(Address.user_id == _id_array_param("user_ids", addresses))
+        .order_by(Address.user_id, Address.id)
+    )
+    for address in await db.fetch_all(query):
+        addresses[address["user_id"]].append(dict(address))
+    return addresses
+
+
+# Embed addresses into already fetched users with one extra query
+async def attach_addresses_repo(users, db: databases.Database):
+    addresses = await get_addresses_by_user_ids_repo([user["id"] for user in users], db)
+    return [{**user, "addresses": addresses[user["id"]]} for user in users]
+
+
+# List Users with addresses in a single LEFT OUTER JOIN query
+async def list_user_with_addresses_joined_repo(
+    db: databases.Database, filters: dict = None, fields: List[str] = None
+):
+    # The join groups rows by user id, so it is always selected
+    user_columns = _user_columns(fields and list(dict.fromkeys(["id", *fields])))
+    query = (
+        select(
+            *user_columns,
+            Address.id.label("address_id"),
+            Address.street.label("address_street"),
+            Address.city.label("address_city"),
+        )
+        .select_from(User.__table__.outerjoin(Address.__table__))
+        .where(*_user_filter_conditions(filters or {}))
+        .order_by(func.lower(User.name).asc(), User.id, Address.id)
+    )
+    users = {}
+    for row in await db.fetch_all(query):
+        user = users.get(row["id"])
+        if user is None:
+            user = users[row["id"]] = {
+                column.name: row[column.name] for column in user_columns
+            }
+            user["addresses"] = []
+        if row["address_id"] is not None:
+            user["addresses"].append(
+                {
+                    "id": row["address_id"],
+                    "user_id": row["id"],
+                    "street": row["address_street"],
+                    "city": row["address_city"],
+                }
+            )
+    return list(users.values())
+
+
+# List Addresses of a User
+async def list_user_address_repo(user_id: int, db: databases.Database):
+    await get_user_repo(user_id, db)
+    addresses = await get_addresses_by_user_ids_repo([user_id], db)
+    return addresses[user_id]
+
+
+# Create Address for a User
+async def create_address_repo(user_id: int, data: dict, db: databases.Database):
+    query = insert(Address).values(user_id=user_id, **data).returning(*ADDRESS_COLUMNS)
+    try:
+        address = await db.fetch_one(query)
+    except ForeignKeyViolationError:  # `databases` raises the asyncpg error as is
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="User not found")
+    return address
+
+
+# Read Address
+async def get_address_repo(address_id: int, db: databases.Database):
+    return await address_repository.get(address_id, db)
+
+
+# Delete Address
+async def delete_address_repo(address_id: int, db: databases.Database):
+    await address_repository.delete(address_id, db)
+    return {"message": "Address deleted"}
+
+
+# Warm up before taking traffic: run the hot lookups once on each of `connections`
+# pool connections, so connections are open and asyncpg has prepared the statements.
+async def warm_up_repo(db: databases.Database, connections: int):
+    async def warm_up_connection():
+        # Each gathered task holds its own pool connection
+        async with db.connection() as connection:
+            await get_users_by_ids_repo([0], connection)
+            await get_addresses_by_user_ids_repo([0], connection)
+
+    await asyncio.gather(*[warm_up_connection() for _ in range(connections)])
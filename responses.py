@@ -1,5 +1,7 @@
-from typing import Any, Generic, List, TypeVar
-from pydantic import BaseModel, Field, field_validator, ConfigDict
+from functools import lru_cache
+from datetime import datetime
+from typing import Any, FrozenSet, Generic, List, Type, TypeVar
+from pydantic import BaseModel, Field, create_model, field_validator, ConfigDict
 from pydantic.alias_generators import to_camel
 
 
@@ -33,6 +35,74 @@ class UserResponseModel(ApiResponseBase):
         return v.title()
 
 
+# Response model restricted to `fields` (sparse fieldsets); the field validators
+# of `model` that touch a kept field are carried over. Cached per combination.
+@lru_cache(maxsize=256)
+def sparse_response_model(
+    model: Type[ApiResponseBase], fields: FrozenSet[str]
+) -> Type[ApiResponseBase]:
+    definitions = {
+        name: (info.annotation, info)
+        for name, info in model.model_fields.items()
+        if name in fields
+    }
+    validators = {}
+    for name, decorator in model.__pydantic_decorators__.field_validators.items():
+        kept = [field for field in decorator.info.fields if field in fields]
+        if kept:
+            validators[name] = field_validator(*kept, mode=decorator.info.mode)(
+                decorator.func.__func__
+            )
+    return create_model(
+        f"{model.__name__}[{','.join(sorted(fields))}]",
+        __base__=ApiResponseBase,
+        __validators__=validators,
+        **definitions,
+    )
+
+
+class AddressResponseModel(ApiResponseBase):
+    id: int
+    user_id: int
+    street: str
+    city: str
+
+
+# User with its addresses embedded (`?include=addresses`)
+class UserWithAddressesResponseModel(UserResponseModel):
+    addresses: List[AddressResponseModel] = Field(default_factory=list)
+
+
+# One entry of a batch lookup; `user` is None when the ID was not found
+class UserBatchItemResponseModel(ApiResponseBase):
+    id: int
+    found: bool
+    user: UserResponseModel | None = None
+
+
+# User search hit; `rank` is only set by the ranked search modes
+class UserSearchResponseModel(UserResponseModel):
+    rank: float | None = None
+
+
+class JobResponseModel(ApiResponseBase):
+    id: int
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    result: Any = None
+    error: str | None = None
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+
+# IDs affected by a bulk update or delete
+class UserBulkWriteResponseModel(ApiResponseBase):
+    ids: List[int]
+    count: int
+
+
 class RestApiResponse(BaseModel):
     status_code: int
 
@@ -40,3 +110,12 @@ class RestApiResponse(BaseModel):
 class RestApiResultResponse(RestApiResponse):
     message: str
     data: Any
+
+
+class PaginationModel(BaseModel):
+    limit: int
+    next_cursor: str | None = None
+
+
+class RestApiPaginatedResponse(RestApiResultResponse):
+    pagination: PaginationModel
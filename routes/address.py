@@ -0,0 +1,39 @@
+from http import HTTPStatus
+from starlette.requests import Request
+from starlette.routing import Route
+
+from dependencies import get_db
+from repositories import delete_address_repo, get_address_repo
+from responses import AddressResponseModel
+from utils import build_json_response
+
+
+# Read Address
+async def get_address_endpoint(request: Request):
+    db = get_db(request)
+    address_id = int(request.path_params["address_id"])
+    address = await get_address_repo(address_id, db)
+    return await build_json_response(
+        query=address,
+        response_model=AddressResponseModel,
+        messages="Address retrieved successfully.",
+        status_code=HTTPStatus.OK,
+    )
+
+
+# Delete Address
+async def delete_address_endpoint(request: Request):
+    db = get_db(request)
+    address_id = int(request.path_params["address_id"])
+    await delete_address_repo(address_id, db)
+    return await build_json_response(
+        response_model=AddressResponseModel,
+        messages="Address deleted successfully.",
+        status_code=HTTPStatus.OK,
+    )
+
+
+routes = [
+    Route("/{address_id:int}/", endpoint=get_address_endpoint, methods=["GET"]),
+    Route("/{address_id:int}/", endpoint=delete_address_endpoint, methods=["DELETE"]),
+]
@@ -0,0 +1,26 @@
+from http import HTTPStatus
+from starlette.requests import Request
+from starlette.routing import Route
+
+from dependencies import get_db
+from jobs import get_job_repo
+from responses import JobResponseModel
+from utils import build_json_response
+
+
+# Read Job status
+async def get_job_endpoint(request: Request):
+    db = get_db(request)
+    job_id = int(request.path_params["job_id"])
+    job = await get_job_repo(job_id, db)
+    return await build_json_response(
+        query=job,
+        response_model=JobResponseModel,
+        messages="Job retrieved successfully.",
+        status_code=HTTPStatus.OK,
+    )
+
+
+routes = [
+    Route("/{job_id:int}/", endpoint=get_job_endpoint, methods=["GET"]),
+]
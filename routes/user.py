@@ -1,28 +1,93 @@
 from http import HTTPStatus
+from starlette.exceptions import HTTPException
 from starlette.requests import Request
 from dependencies import get_db
+from jobs import enqueue_job
 from repositories import (
+    attach_addresses_repo,
+    batch_get_user_repo,
     bulk_create_user_repo,
+    bulk_delete_user_repo,
+    bulk_update_user_repo,
+    create_address_repo,
     create_user_repo,
     delete_user_repo,
     get_user_repo,
+    list_user_address_repo,
+    list_user_with_addresses_joined_repo,
+    search_user_repo,
     update_user_repo,
     list_user_repo,
 )
-from models import BulkCreateUserModel, UserCreateModel, UserUpdateModel
+from models import (
+    AddressCreateModel,
+    BatchGetUserModel,
+    BulkCreateUserModel,
+    BulkDeleteUserModel,
+    BulkUpdateUserModel,
+    UserCreateModel,
+    UserListQueryModel,
+    UserSearchQueryModel,
+    UserUpdateModel,
+)
 from starlette.routing import Route
 
-from responses import UserResponseModel
-from utils import build_json_response
+from responses import (
+    AddressResponseModel,
+    JobResponseModel,
+    UserBatchItemResponseModel,
+    UserBulkWriteResponseModel,
+    UserResponseModel,
+    UserSearchResponseModel,
+    UserWithAddressesResponseModel,
+    sparse_response_model,
+)
+from utils import build_json_response, decode_cursor, encode_cursor
+
+
+# Strategies for embedding addresses: one batched ANY() query or a single join
+ADDRESS_LOAD_STRATEGIES = ("selectin", "joined")
+
+
+# Returns the address loading strategy, or None when addresses are not included
+def get_address_load_strategy(request: Request):
+    include = request.query_params.get("include", "").split(",")
+    if "addresses" not in include:
+        return None
+    strategy = request.query_params.get("load", "selectin")
+    if strategy not in ADDRESS_LOAD_STRATEGIES:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f"load must be one of: {', '.join(ADDRESS_LOAD_STRATEGIES)}",
+        )
+    return strategy
 
 
 # List User
 async def list_user_endpoint(request: Request):
     db = request.state.db
-    users = await list_user_repo(db)
+    strategy = get_address_load_strategy(request)
+    params = UserListQueryModel.model_validate(dict(request.query_params))
+    filters = params.model_dump(include={"is_active", "email_domain"})
+    fields = params.fields
+    if strategy == "joined":
+        users = await list_user_with_addresses_joined_repo(db, filters, fields)
+    elif strategy == "selectin":
+        # Addresses are attached by user id, so it is always selected
+        select_fields = fields and list(dict.fromkeys(["id", *fields]))
+        users = await list_user_repo(db, filters, select_fields)
+        users = await attach_addresses_repo(users, db)
+    else:
+        users = await list_user_repo(db, filters, fields)
+
+    response_model = UserWithAddressesResponseModel if strategy else UserResponseModel
+    if fields:
+        response_model = sparse_response_model(
+            response_model, frozenset(fields + ["addresses"] if strategy else fields)
+        )
     return await build_json_response(
         query=users,
-        response_model=UserResponseModel,
+        response_model=response_model,
         messages="Users retrieved successfully.",
         status_code=HTTPStatus.OK,
     )
@@ -46,10 +111,16 @@ async def create_user_endpoint(request: Request):
 async def get_user_endpoint(request: Request):
     db = get_db(request)
     user_id = int(request.path_params["user_id"])
+    strategy = get_address_load_strategy(request)
     user = await get_user_repo(user_id, db=db)
+    # A single user only needs one extra query, whichever strategy is asked for
+    if strategy:
+        [user] = await attach_addresses_repo([user], db)
     return await build_json_response(
         query=user,
-        response_model=UserResponseModel,
+        response_model=UserWithAddressesResponseModel
+        if strategy
+        else UserResponseModel,
         messages="User retrieved successfully.",
         status_code=HTTPStatus.OK,
     )
@@ -83,11 +154,19 @@ async def delete_user_endpoint(request: Request):
     )
 
 
-# Bulk Create User
+# Bulk Create User; with ?background=true the import runs as a background job
 async def bulk_create_user_endpoint(request: Request):
     db = get_db(request)
     data = await request.json()
     bulk_create_model = BulkCreateUserModel.model_validate(data)
+    if request.query_params.get("background") == "true":
+        job = await enqueue_job("users.bulk_create", bulk_create_model.model_dump(), db)
+        return await build_json_response(
+            query=job,
+            response_model=JobResponseModel,
+            messages="Bulk user creation queued.",
+            status_code=HTTPStatus.ACCEPTED,
+        )
     create_users = await bulk_create_user_repo(bulk_create_model.model_dump(), db)
     return await build_json_response(
         query=create_users,
@@ -97,11 +176,119 @@ async def bulk_create_user_endpoint(request: Request):
     )
 
 
+# Bulk Update Users by per-user values, ID list or filter
+async def bulk_update_user_endpoint(request: Request):
+    db = get_db(request)
+    data = await request.json()
+    bulk_update_model = BulkUpdateUserModel.model_validate(data)
+    user_ids = await bulk_update_user_repo(
+        bulk_update_model.model_dump(exclude_unset=True), db
+    )
+    return await build_json_response(
+        query={"ids": user_ids, "count": len(user_ids)},
+        response_model=UserBulkWriteResponseModel,
+        messages="Users updated successfully.",
+        status_code=HTTPStatus.OK,
+    )
+
+
+# Bulk Delete Users by ID list or filter
+async def bulk_delete_user_endpoint(request: Request):
+    db = get_db(request)
+    data = await request.json()
+    bulk_delete_model = BulkDeleteUserModel.model_validate(data)
+    user_ids = await bulk_delete_user_repo(
+        bulk_delete_model.model_dump(exclude_unset=True), db
+    )
+    return await build_json_response(
+        query={"ids": user_ids, "count": len(user_ids)},
+        response_model=UserBulkWriteResponseModel,
+        messages="Users deleted successfully.",
+        status_code=HTTPStatus.OK,
+    )
+
+
+# Batch Read Users
+async def batch_get_user_endpoint(request: Request):
+    db = get_db(request)
+    data = await request.json()
+    batch_get_model = BatchGetUserModel.model_validate(data)
+    users = await batch_get_user_repo(batch_get_model.ids, db)
+    return await build_json_response(
+        query=users,
+        response_model=UserBatchItemResponseModel,
+        messages="Users retrieved successfully.",
+        status_code=HTTPStatus.OK,
+    )
+
+
+# List User Addresses
+async def list_user_address_endpoint(request: Request):
+    db = get_db(request)
+    user_id = int(request.path_params["user_id"])
+    addresses = await list_user_address_repo(user_id, db)
+    return await build_json_response(
+        query=addresses,
+        response_model=AddressResponseModel,
+        messages="Addresses retrieved successfully.",
+        status_code=HTTPStatus.OK,
+    )
+
+
+# Create User Address
+async def create_user_address_endpoint(request: Request):
+    db = get_db(request)
+    user_id = int(request.path_params["user_id"])
+    data = await request.json()
+    address_data = AddressCreateModel.model_validate(data)
+    address = await create_address_repo(user_id, address_data.model_dump(), db)
+    return await build_json_response(
+        query=address,
+        response_model=AddressResponseModel,
+        messages="Address created successfully.",
+        status_code=HTTPStatus.CREATED,
+    )
+
+
+# Search Users
+async def search_user_endpoint(request: Request):
+    db = get_db(request)
+    search = UserSearchQueryModel.model_validate(dict(request.query_params))
+    after = decode_cursor(search.after) if search.after else None
+    users, next_key = await search_user_repo(
+        search.q, search.mode, search.limit, after, db
+    )
+    return await build_json_response(
+        query=users,
+        response_model=UserSearchResponseModel,
+        messages="Users retrieved successfully.",
+        status_code=HTTPStatus.OK,
+        pagination={
+            "limit": search.limit,
+            "next_cursor": encode_cursor(next_key) if next_key else None,
+        },
+    )
+
+
 routes = [
     Route("/", endpoint=list_user_endpoint, methods=["GET"]),
     Route("/", endpoint=create_user_endpoint, methods=["POST"]),
     Route("/bulk/", endpoint=bulk_create_user_endpoint, methods=["POST"]),
+    Route("/bulk/", endpoint=bulk_update_user_endpoint, methods=["PATCH"]),
+    Route("/bulk/", endpoint=bulk_delete_user_endpoint, methods=["DELETE"]),
+    Route("/batch/", endpoint=batch_get_user_endpoint, methods=["POST"]),
+    Route("/search/", endpoint=search_user_endpoint, methods=["GET"]),
     Route("/{user_id:int}/", endpoint=get_user_endpoint, methods=["GET"]),
     Route("/{user_id:int}/", endpoint=update_user_endpoint, methods=["PATCH"]),
     Route("/{user_id:int}/", endpoint=delete_user_endpoint, methods=["DELETE"]),
+    Route(
+        "/{user_id:int}/addresses/",
+        endpoint=list_user_address_endpoint,
+        methods=["GET"],
+    ),
+    Route(
+        "/{user_id:int}/addresses/",
+        endpoint=create_user_address_endpoint,
+        methods=["POST"],
+    ),
 ]
@@ -3,20 +3,33 @@ from starlette.responses import JSONResponse
 from starlette.routing import Route, WebSocketRoute
 from starlette.websockets import WebSocketDisconnect
 
+from ratelimit import WS_MESSAGE_RATE_LIMIT, rate_limit_store
 from ws_connection import (
     connection_manager,
     handle_websocket_message,
 )
+from ws_protocol import receive_message
 
 
 # WebSocket endpoint function
 async def websocket_endpoint(websocket):
     connection_id = await connection_manager.connect(websocket)
+    if connection_id is None:
+        return  # Not accepted (server draining or accept failed)
+    protocol = connection_manager.get_protocol(connection_id)
 
     try:
         while True:
             try:
-                data = await websocket.receive_text()
+                data = await receive_message(websocket, protocol)
+                if data != "pong" and await rate_limit_store.consume(
+                    f"ws:{connection_id}", WS_MESSAGE_RATE_LIMIT
+                ):
+                    await connection_manager.send_message(
+                        connection_id,
+                        {"type": "error", "message": "Rate limit exceeded."},
+                    )
+                    continue
                 await handle_websocket_message(connection_id, data)
 
             except WebSocketDisconnect:
@@ -1,7 +1,19 @@
 # SQLAlchemy ORM supports mapping Python classes to database tables. Relationships, indexes, and constraints are defined here.
 
 from datetime import datetime
-from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, DateTime
+from sqlalchemy import (
+    DDL,
+    Boolean,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    DateTime,
+    literal_column,
+    text,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base, relationship, declared_attr
 from sqlalchemy.sql import func
 from sqlalchemy import event
@@ -38,14 +50,31 @@ class Address(Base, TimestampMixin):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(
-        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
-    )
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )  # Indexed so batched address loads by user_id do not scan the table
     street = Column(String, nullable=False)
     city = Column(String, nullable=False)
 
     user = relationship("User", back_populates="addresses")
 
 
+# Durable background job queue, claimed by workers with FOR UPDATE SKIP LOCKED
+class Job(Base, TimestampMixin):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    # Server-side defaults: `databases` does not apply Python-side scalar defaults
+    status = Column(String, nullable=False, server_default="queued")
+    attempts = Column(Integer, nullable=False, server_default="0")
+    max_attempts = Column(Integer, nullable=False, server_default="3")
+    run_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_until = Column(DateTime(timezone=True))  # Lease of a running job
+    result = Column(JSONB)
+    error = Column(String)
+
+
 @event.listens_for(User, "before_insert")
 def receive_before_insert(mapper, connection, target):
     target.created_at = datetime.datetime.now()
@@ -58,3 +87,45 @@ def receive_before_update(mapper, connection, target):
 
 # Define indexes for performance optimization
 Index("ix_user_email", User.email, unique=True)
+Index("ix_jobs_status_run_at", Job.status, Job.run_at)  # Claiming the next job
+
+
+# Search indexes. Queries reuse these exact expressions so the planner matches them.
+USER_SEARCH_CONFIG = text("'simple'::regconfig")
+USER_SEARCH_VECTOR = func.to_tsvector(
+    USER_SEARCH_CONFIG,
+    User.name.concat(literal_column("' '", String)).concat(User.email),
+)
+
+# pg_trgm provides the trigram operator classes used by the trigram indexes
+event.listen(
+    Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+)
+
+Index("ix_users_name_lower", func.lower(User.name))  # ORDER BY lower(name) + keyset
+
+# Prefix search keys in byte order: a prefix is the range [term, next string), an
+# index range scan in any database collation, and each index keeps its page order
+USER_NAME_PREFIX_KEY = func.lower(User.name).collate("C")
+USER_EMAIL_PREFIX_KEY = func.lower(User.email).collate("C")
+Index("ix_users_name_prefix", USER_NAME_PREFIX_KEY, User.id)
+Index("ix_users_email_prefix", USER_EMAIL_PREFIX_KEY, User.id)
+Index(
+    "ix_users_name_trgm_gist",
+    func.lower(User.name).label("name_lower"),
+    postgresql_using="gist",
+    postgresql_ops={"name_lower": "gist_trgm_ops"},
+)  # Similarity on names, nearest first (ORDER BY <->)
+Index(
+    "ix_users_email_trgm_gist",
+    func.lower(User.email).label("email_lower"),
+    postgresql_using="gist",
+    postgresql_ops={"email_lower": "gist_trgm_ops"},
+)  # Similarity on emails, nearest first
+Index(
+    "ix_users_email_trgm",
+    func.lower(User.email).label("email_lower"),
+    postgresql_using="gin",
+    postgresql_ops={"email_lower": "gin_trgm_ops"},
+)  # email_domain filter (LIKE '%@domain')
+Index("ix_users_search", USER_SEARCH_VECTOR, postgresql_using="gin")  # Full-text
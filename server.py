@@ -0,0 +1,143 @@
+"""Production server: pre-forks one uvicorn worker per CPU core on a shared socket.
+
+    python server.py --host 0.0.0.0 --port 8000 --workers 4
+
+The parent binds the listening socket once and forks the workers, which accept from
+it directly. Each worker imports the app itself (after the fork, inside its own event
+loop) and only starts accepting once the lifespan startup, including the database
+warm-up, has finished. uvloop and httptools are used when installed.
+
+On SIGTERM/SIGINT the parent forwards the signal to every worker. A worker stops
+accepting, closes its WebSockets with 1001 (going away), lets in-flight requests
+finish and runs the lifespan shutdown. Workers that die unexpectedly are restarted.
+
+Every worker has its own database pool (config.DATABASE_POOL_MAX_SIZE connections),
+so keep workers * pool size below the Postgres max_connections.
+"""
+
+import argparse
+import importlib.util
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+import uvicorn
+
+GRACEFUL_SHUTDOWN_TIMEOUT = 30  # seconds for in-flight requests when draining
+RESTART_DELAY = 1  # seconds before replacing a worker that died
+
+
+class DrainingServer(uvicorn.Server):
+    async def shutdown(self, sockets=None):
+        # Close WebSockets with a proper code before uvicorn drops the connections
+        from ws_connection import connection_manager
+
+        await connection_manager.drain()
+        await super().shutdown(sockets)
+
+
+def create_socket(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def uvicorn_config(args) -> uvicorn.Config:
+    return uvicorn.Config(
+        args.app,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+        lifespan="on",
+        backlog=args.backlog,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
+        access_log=args.access_log,
+    )
+
+
+def run_worker(index: int, sock: socket.socket, args):
+    if args.pin_cpus and hasattr(os, "sched_setaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+        os.sched_setaffinity(0, {cpus[index % len(cpus)]})
+    # Default signal handling again; uvicorn installs its own in the worker
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    DrainingServer(uvicorn_config(args)).run(sockets=[sock])
+
+
+def spawn(index: int, sock: socket.socket, args) -> int:
+    pid = os.fork()
+    if pid == 0:
+        # Own process group: a terminal Ctrl-C reaches only the parent, which then
+        # sends a single SIGTERM (a second signal would make uvicorn force-exit)
+        os.setpgid(0, 0)
+        code = 0
+        try:
+            run_worker(index, sock, args)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the app with pre-forked workers.")
+    parser.add_argument("app", nargs="?", default="main:app")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument(
+        "--pin-cpus", action="store_true", help="pin each worker to one core"
+    )
+    parser.add_argument("--access-log", action="store_true")
+    args = parser.parse_args()
+
+    sock = create_socket(args.host, args.port, args.backlog)
+    workers = {spawn(index, sock, args): index for index in range(args.workers)}
+    print(
+        f"Serving on {args.host}:{args.port} with {args.workers} workers "
+        f"(pid {os.getpid()})",
+        file=sys.stderr,
+    )
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = workers.pop(pid, None)
+        if index is not None and not stopping:
+            print(f"Worker {pid} exited ({status}), restarting", file=sys.stderr)
+            time.sleep(RESTART_DELAY)  # Avoid a tight loop if workers keep failing
+            if stopping:  # Signalled during the delay: stop() missed the new worker
+                continue
+            workers[spawn(index, sock, args)] = index
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import pytest
+
+
+# Async tests run with anyio's pytest plugin (installed with starlette)
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+class FakeClock:
+    """Stands in for the `time` module of the code under test."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+async def redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # fakeredis runs Lua scripts with lupa
+    client = fakeredis.FakeAsyncRedis()
+    yield client
+    await client.aclose()
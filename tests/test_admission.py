@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+from admission import (
+    DEFAULT_ADMISSION_RULES,
+    AdmissionController,
+    AdmissionRejected,
+    AdmissionRule,
+)
+
+pytestmark = pytest.mark.anyio
+
+READ = AdmissionRule("read", priority=0, methods=("GET",), path=r"/")
+WRITE = AdmissionRule("write", priority=1, methods=("POST",), path=r"/")
+BULK = AdmissionRule(
+    "bulk", priority=2, methods=("PATCH",), path=r"/", max_concurrency=1
+)
+RULES = (READ, WRITE, BULK)
+
+
+def controller(**kwargs) -> AdmissionController:
+    return AdmissionController(RULES, **{"limit": 1, "max_queue": 10, **kwargs})
+
+
+async def queue(controller, rule):
+    """Start acquire() in a task and let it reach the queue."""
+    task = asyncio.create_task(controller.acquire(rule))
+    await asyncio.sleep(0)
+    assert not task.done()
+    return task
+
+
+async def test_admits_up_to_the_limit():
+    admission = controller(limit=2)
+    await admission.acquire(READ)
+    await admission.acquire(WRITE)
+    assert admission.in_flight == 2
+    waiter = await queue(admission, READ)
+    admission.release(WRITE)
+    await waiter
+    assert admission.in_flight == 2
+
+
+async def test_wakes_higher_priority_first():
+    admission = controller()
+    await admission.acquire(READ)
+    waiters = [await queue(admission, rule) for rule in (BULK, WRITE, READ)]
+    running = READ
+    # Each release admits exactly one waiter, in priority order
+    for rule in (READ, WRITE, BULK):
+        admission.release(running)
+        assert admission.in_flight == 1
+        assert admission._active[rule] == 1
+        running = rule
+    await asyncio.gather(*waiters)
+
+
+async def test_per_rule_cap_lets_others_pass():
+    admission = controller(limit=3)
+    await admission.acquire(BULK)
+    bulk = await queue(admission, BULK)  # Over the bulk cap, though slots are free
+    await admission.acquire(WRITE)  # A lower priority waiter does not block it
+    assert admission.in_flight == 2
+    admission.release(BULK)
+    await bulk
+    assert admission._active[BULK] == 1
+
+
+async def test_rejects_when_the_queue_is_full():
+    admission = controller(max_queue=1)
+    await admission.acquire(WRITE)
+    waiter = await queue(admission, WRITE)
+    with pytest.raises(AdmissionRejected) as error:
+        await admission.acquire(WRITE)
+    assert error.value.retry_after >= 1
+    waiter.cancel()
+
+
+async def test_rejects_over_the_queue_share():
+    rule = AdmissionRule("small", priority=1, methods=("PUT",), path="/")
+    admission = AdmissionController((READ, rule), limit=1, max_queue=4)
+    rule.queue_share = 0.5
+    await admission.acquire(READ)
+    waiters = [await queue(admission, rule) for _ in range(2)]
+    with pytest.raises(AdmissionRejected):
+        await admission.acquire(rule)
+    # The rest of the queue is still open to other rules
+    waiters.append(await queue(admission, READ))
+    for waiter in waiters:
+        waiter.cancel()
+
+
+async def test_full_queue_evicts_the_newest_lower_priority_waiter():
+    admission = controller(max_queue=2)
+    await admission.acquire(READ)
+    older = await queue(admission, BULK)
+    newer = await queue(admission, WRITE)
+    read = await queue(admission, READ)
+    # WRITE is the higher priority of the two, so BULK is evicted
+    with pytest.raises(AdmissionRejected):
+        await older
+    assert not newer.done()
+    admission.release(READ)
+    await read
+    assert not newer.done()  # The read went first
+    assert admission._queued == {READ: 0, WRITE: 1, BULK: 0}
+    newer.cancel()
+
+
+async def test_full_queue_of_reads_rejects_reads():
+    admission = controller(max_queue=1)
+    await admission.acquire(READ)
+    waiter = await queue(admission, READ)
+    with pytest.raises(AdmissionRejected):
+        await admission.acquire(READ)  # Nothing of lower priority to evict
+    waiter.cancel()
+
+
+async def test_times_out_in_the_queue():
+    admission = controller(queue_timeout=0.01)
+    await admission.acquire(READ)
+    with pytest.raises(AdmissionRejected):
+        await admission.acquire(WRITE)
+    assert admission._queued[WRITE] == 0
+
+
+async def test_cancelled_waiter_leaves_the_queue():
+    admission = controller()
+    await admission.acquire(READ)
+    waiter = await queue(admission, WRITE)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert admission._queued[WRITE] == 0
+    admission.release(READ)
+    assert admission.in_flight == 0  # The slot is not handed to the cancelled waiter
+
+
+async def test_limit_shrinks_on_slow_reads_and_recovers():
+    admission = controller(limit=10, min_limit=2)
+    for latency in [0.01] * 10 + [1.0] * 50:
+        await admission.acquire(READ)
+        admission.release(READ, latency)
+    assert int(admission.limit) == 2
+    for _ in range(500):
+        await admission.acquire(READ)
+        admission.release(READ, 0.01)
+    assert admission.limit == 10
+
+
+async def test_controllers_do_not_share_counts():
+    first, second = AdmissionController(), AdmissionController()
+    rule = DEFAULT_ADMISSION_RULES[-1]
+    await first.acquire(rule)
+    assert first._active[rule] == 1
+    assert second._active[rule] == 0
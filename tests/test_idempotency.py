@@ -0,0 +1,223 @@
+import asyncio
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import idempotency
+from idempotency import InMemoryIdempotencyStore, RedisIdempotencyStore, StoredResponse
+from middleware import IdempotencyMiddleware
+
+pytestmark = pytest.mark.anyio
+
+RESPONSE = StoredResponse(201, b'{"id":1}', "application/json", "fingerprint")
+
+
+@pytest.fixture
+def store(clock, monkeypatch):
+    monkeypatch.setattr(idempotency, "time", clock)
+    return InMemoryIdempotencyStore(ttl=60, max_entries=2)
+
+
+async def test_replays_a_completed_request(store):
+    assert await store.begin("k", "fingerprint") is None
+    await store.complete("k", RESPONSE)
+    assert await store.begin("k", "fingerprint") is RESPONSE
+
+
+async def test_rejects_a_different_request(store):
+    await store.begin("k", "fingerprint")
+    await store.complete("k", RESPONSE)
+    with pytest.raises(HTTPException) as error:
+        await store.begin("k", "other")
+    assert error.value.status_code == 422
+
+
+async def test_duplicate_waits_for_the_first_request(store):
+    await store.begin("k", "fingerprint")
+    duplicate = asyncio.create_task(store.begin("k", "fingerprint"))
+    await asyncio.sleep(0)
+    assert not duplicate.done()
+    await store.complete("k", RESPONSE)
+    assert await duplicate is RESPONSE
+
+
+async def test_duplicate_takes_over_a_released_key(store):
+    await store.begin("k", "fingerprint")
+    duplicate = asyncio.create_task(store.begin("k", "fingerprint"))
+    await asyncio.sleep(0)
+    await store.release("k")
+    assert await duplicate is None  # Now runs the request itself
+
+
+async def test_duplicate_gives_up_after_the_timeout(store):
+    await store.begin("k", "fingerprint")
+    with pytest.raises(HTTPException) as error:
+        await store.begin("k", "fingerprint", timeout=0.01)
+    assert error.value.status_code == 409
+
+
+async def test_responses_expire(store, clock):
+    await store.begin("k", "fingerprint")
+    await store.complete("k", RESPONSE)
+    clock.advance(61)
+    assert await store.begin("k", "fingerprint") is None
+
+
+async def test_oldest_responses_are_evicted_first(store):
+    for key in ("a", "b", "c"):
+        await store.begin(key, "fingerprint")
+        await store.complete(key, RESPONSE)
+    assert list(store._responses) == ["b", "c"]
+
+
+def make_app(store, statuses=None):
+    """POST /users/ answers with the next status of `statuses` (201 once they run
+    out) and counts its calls."""
+    statuses = list(statuses or ())
+
+    async def create(request):
+        app.state.calls += 1
+        await asyncio.sleep(0.01)  # Long enough for duplicates to overlap
+        status = statuses.pop(0) if statuses else 201
+        return JSONResponse({"call": app.state.calls}, status_code=status)
+
+    app = Starlette(
+        routes=[Route("/users/", create, methods=["POST"])],
+        middleware=[Middleware(IdempotencyMiddleware, store=store)],
+    )
+    app.state.calls = 0
+    return app
+
+
+def post(client, key="k", body=None):
+    headers = {"Idempotency-Key": key} if key is not None else {}
+    return client.post("/users/", json=body or {"name": "a"}, headers=headers)
+
+
+def test_middleware_replays_with_header():
+    app = make_app(InMemoryIdempotencyStore())
+    client = TestClient(app)
+    first, second = post(client), post(client)
+    assert first.status_code == second.status_code == 201
+    assert "Idempotent-Replayed" not in first.headers
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.json() == first.json() == {"call": 1}
+    assert app.state.calls == 1
+
+
+def test_middleware_rejects_a_reused_key():
+    client = TestClient(make_app(InMemoryIdempotencyStore()))
+    post(client)
+    assert post(client, body={"name": "b"}).status_code == 422
+
+
+def test_middleware_releases_the_key_on_5xx():
+    app = make_app(InMemoryIdempotencyStore(), statuses=[503])
+    client = TestClient(app)
+    assert post(client).status_code == 503
+    retry = post(client)
+    assert retry.status_code == 201  # Ran again instead of replaying the 503
+    assert "Idempotent-Replayed" not in retry.headers
+    assert app.state.calls == 2
+
+
+def test_middleware_ignores_requests_without_a_key():
+    app = make_app(InMemoryIdempotencyStore())
+    client = TestClient(app)
+    post(client, key=None)
+    post(client, key=None)
+    assert app.state.calls == 2
+    assert post(client, key="").status_code == 400
+
+
+async def test_middleware_duplicates_wait_for_the_first():
+    app = make_app(InMemoryIdempotencyStore())
+    transport = httpx.ASGITransport(app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+        responses = await asyncio.gather(
+            *(
+                client.post("/users/", json={}, headers={"Idempotency-Key": "k"})
+                for _ in range(3)
+            )
+        )
+    assert [response.json() for response in responses] == [{"call": 1}] * 3
+    assert sum("idempotent-replayed" in r.headers for r in responses) == 2
+    assert app.state.calls == 1
+
+
+async def test_redis_replays_to_other_workers(redis):
+    first, second = RedisIdempotencyStore(redis), RedisIdempotencyStore(redis)
+    assert await first.begin("k", "fingerprint") is None
+    await first.complete("k", RESPONSE)
+    stored = await second.begin("k", "fingerprint")
+    assert (stored.status_code, stored.body) == (201, b'{"id":1}')
+    assert 0 < await redis.ttl("idempotency:k") <= first.ttl
+
+
+async def test_redis_rejects_a_different_request(redis):
+    store = RedisIdempotencyStore(redis)
+    await store.begin("k", "fingerprint")
+    await store.complete("k", RESPONSE)
+    with pytest.raises(HTTPException) as error:
+        await store.begin("k", "other")
+    assert error.value.status_code == 422
+
+
+async def test_redis_duplicate_waits_then_gives_up(redis):
+    first, second = RedisIdempotencyStore(redis), RedisIdempotencyStore(redis)
+    await first.begin("k", "fingerprint")
+    with pytest.raises(HTTPException) as error:
+        await second.begin("k", "fingerprint", timeout=0.1)
+    assert error.value.status_code == 409
+    await first.release("k")
+    assert await second.begin("k", "fingerprint") is None  # Takes over
+
+
+async def test_redis_placeholders_are_unique(redis):
+    store = RedisIdempotencyStore(redis)
+    await store.begin("a", "fingerprint")
+    await store.begin("b", "fingerprint")
+    a, b = await redis.get("idempotency:a"), await redis.get("idempotency:b")
+    assert a.startswith(b"pending:") and b.startswith(b"pending:")
+    assert a != b
+    await store.release("a")
+    await store.release("b")
+    assert await redis.exists("idempotency:a", "idempotency:b") == 0
+
+
+async def test_redis_running_request_keeps_its_key(redis):
+    store = RedisIdempotencyStore(redis, lease_ttl=1)
+    await store.begin("k", "fingerprint")
+    placeholder = await redis.get("idempotency:k")
+    await asyncio.sleep(1.5)  # Past the lease, refreshed every third of it
+    assert await redis.get("idempotency:k") == placeholder
+    await store.complete("k", RESPONSE)
+    assert await redis.ttl("idempotency:k") > 1
+
+
+async def test_redis_expired_owner_cannot_touch_the_new_claim(redis):
+    first, second = RedisIdempotencyStore(redis), RedisIdempotencyStore(redis)
+    await first.begin("k", "fingerprint")
+    await redis.delete("idempotency:k")  # The placeholder expired
+    await second.begin("k", "fingerprint")
+    placeholder = await redis.get("idempotency:k")
+    await first.release("k")
+    assert await redis.get("idempotency:k") == placeholder
+    await first.complete("k", RESPONSE)
+    assert await redis.get("idempotency:k") == placeholder
+    await second.complete("k", RESPONSE)
+    assert await redis.get("idempotency:k") == RESPONSE.dumps()
+
+
+async def test_redis_stores_a_response_after_an_unclaimed_expiry(redis):
+    store = RedisIdempotencyStore(redis)
+    await store.begin("k", "fingerprint")
+    await redis.delete("idempotency:k")
+    await store.complete("k", RESPONSE)
+    assert await redis.get("idempotency:k") == RESPONSE.dumps()
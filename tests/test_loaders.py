@@ -0,0 +1,46 @@
+import asyncio
+
+import databases
+import pytest
+
+from loaders import BatchLoader, in_transaction
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_loads_in_the_same_tick_share_one_batch():
+    batches = []
+
+    async def batch_fn(keys):
+        batches.append(keys)
+        return {key: key * 10 for key in keys if key != 3}
+
+    loader = BatchLoader(batch_fn)
+    results = await asyncio.gather(*(loader.load(key) for key in (1, 2, 1, 3)))
+    assert results == [10, 20, 10, None]
+    assert batches == [[1, 2, 3]]
+
+
+async def test_batch_errors_reach_every_caller():
+    async def batch_fn(keys):
+        raise RuntimeError("down")
+
+    loader = BatchLoader(batch_fn)
+    results = await asyncio.gather(
+        loader.load(1), loader.load(2), return_exceptions=True
+    )
+    assert [str(result) for result in results] == ["down", "down"]
+
+
+async def test_in_transaction_without_a_connection():
+    # No query has run on this task, so there is no connection to ask
+    db = databases.Database("postgresql://localhost/unused")
+    assert not in_transaction(db)
+
+
+async def test_databases_internals_used_by_in_transaction():
+    # in_transaction() reads these; an upgrade that renames them must fail here
+    db = databases.Database("postgresql://localhost/unused")
+    assert db._global_connection is None
+    assert hasattr(db, "_connection_map")
+    assert db.connection()._transaction_stack == []
@@ -0,0 +1,145 @@
+import asyncio
+import math
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+import ratelimit
+from middleware import RateLimitMiddleware
+from ratelimit import InMemoryTokenBucketStore, RateLimitRule, RedisTokenBucketStore
+
+pytestmark = pytest.mark.anyio
+
+RULE = RateLimitRule("test", rate=2, burst=3)
+
+
+@pytest.fixture
+def store(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return InMemoryTokenBucketStore(shards=4, sweep_interval=1.0)
+
+
+async def test_burst_then_limited(store):
+    assert [await store.consume("a", RULE) for _ in range(3)] == [0, 0, 0]
+    assert await store.consume("a", RULE) == pytest.approx(0.5)
+
+
+async def test_refill(store, clock):
+    for _ in range(3):
+        await store.consume("a", RULE)
+    clock.advance(0.25)
+    # Half a token refilled: the wait is the time to refill the other half
+    assert await store.consume("a", RULE) == pytest.approx(0.25)
+    clock.advance(0.25)
+    assert await store.consume("a", RULE) == 0
+
+
+async def test_refill_is_capped_at_burst(store, clock):
+    await store.consume("a", RULE)
+    clock.advance(3600)
+    assert [await store.consume("a", RULE) for _ in range(3)] == [0, 0, 0]
+    assert await store.consume("a", RULE) > 0
+
+
+async def test_clients_have_separate_buckets(store):
+    for _ in range(3):
+        await store.consume("a", RULE)
+    assert await store.consume("a", RULE) > 0
+    assert await store.consume("b", RULE) == 0
+
+
+async def test_sweep_expires_idle_buckets(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, "time", clock)
+    store = InMemoryTokenBucketStore(shards=1, sweep_interval=1.0)
+    await store.consume("idle", RULE)
+    clock.advance(RULE.ttl - 1)
+    await store.consume("active", RULE)
+    clock.advance(2)  # "idle" is now past its TTL, "active" is not
+    await store.consume("other", RULE)  # Triggers the sweep of the only shard
+    assert set(store._shards[0]) == {"active", "other"}
+
+
+async def test_sweep_visits_one_shard_per_interval(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, "time", clock)
+    store = InMemoryTokenBucketStore(shards=2, sweep_interval=1.0)
+    keys = set(map(str, range(20)))
+    for key in keys:
+        await store.consume(key, RULE)
+
+    def remaining():
+        return {key for shard in store._shards for key in shard} & keys
+
+    clock.advance(RULE.ttl + 1)
+    await store.consume("x", RULE)
+    assert set() < remaining() < keys  # Only the first shard was swept
+    clock.advance(1)
+    await store.consume("x", RULE)
+    assert remaining() == set()
+
+
+def make_app(store, rule):
+    async def ok(request):
+        return JSONResponse({"ok": True})
+
+    return Starlette(
+        routes=[Route("/", ok)],
+        middleware=[Middleware(RateLimitMiddleware, rules=(rule,), store=store)],
+    )
+
+
+def test_middleware_returns_429_with_retry_after(store):
+    rule = RateLimitRule("slow", rate=0.25, burst=1)
+    client = TestClient(make_app(store, rule))
+    assert client.get("/").status_code == 200
+    response = client.get("/")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(math.ceil(1 / rule.rate))
+
+
+def test_middleware_ignores_client_supplied_keys(store):
+    client = TestClient(make_app(store, RateLimitRule("slow", rate=0.25, burst=1)))
+    statuses = [
+        client.get("/", headers={"X-API-Key": f"key-{n}"}).status_code for n in range(5)
+    ]
+    assert statuses == [200, 429, 429, 429, 429]
+    assert sum(len(shard) for shard in store._shards) == 1
+
+
+async def test_middleware_limits_each_address(store):
+    app = make_app(store, RateLimitRule("slow", rate=0.25, burst=1))
+
+    async def get(host):
+        transport = httpx.ASGITransport(app, client=(host, 1234))
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            return (await c.get("/")).status_code
+
+    assert [await get("10.0.0.1"), await get("10.0.0.1")] == [200, 429]
+    assert await get("10.0.0.2") == 200
+
+
+async def test_redis_burst_then_limited(redis):
+    store = RedisTokenBucketStore(redis)
+    assert [await store.consume("a", RULE) for _ in range(3)] == [0, 0, 0]
+    # The server clock moves on between calls, so allow for a little refill
+    assert 0.45 < await store.consume("a", RULE) <= 0.5
+
+
+async def test_redis_refill(redis):
+    rule = RateLimitRule("fast", rate=50, burst=1)
+    store = RedisTokenBucketStore(redis)
+    assert await store.consume("a", rule) == 0
+    assert await store.consume("a", rule) > 0
+    await asyncio.sleep(1 / rule.rate)
+    assert await store.consume("a", rule) == 0
+
+
+async def test_redis_buckets_expire(redis):
+    store = RedisTokenBucketStore(redis, prefix="rl:")
+    await store.consume("a", RULE)
+    assert 0 < await redis.ttl("rl:a") <= RULE.ttl
+    assert await store.consume("b", RULE) == 0
@@ -1,13 +1,38 @@
+import base64
+import json
 from http import HTTPStatus
 from typing import List, Type
 
+from starlette.exceptions import HTTPException
 from starlette.responses import JSONResponse
 
-from responses import ApiResponseBase, ListResponseModel, RestApiResultResponse
+from responses import (
+    ApiResponseBase,
+    ListResponseModel,
+    RestApiPaginatedResponse,
+    RestApiResultResponse,
+)
 
 
-async def response_builder(data: dict):
-    json_response = RestApiResultResponse.model_validate(data)  # Validate the data
+# Opaque keyset cursor holding the sort key values of the last returned row
+def encode_cursor(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        values = None
+    if not isinstance(values, list):
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+async def response_builder(data: dict, response_class=RestApiResultResponse):
+    json_response = response_class.model_validate(data)  # Validate the data
     return JSONResponse(
         content=json_response.model_dump(exclude={"status_code"}, by_alias=True),
         status_code=int(json_response.status_code),
@@ -44,6 +69,7 @@ async def build_json_response(
     messages: str,
     status_code: HTTPStatus,
     query: List[dict] | dict = None,
+    pagination: dict = None,
 ) -> JSONResponse:
     json_data = await convert_to_json_response(
         query=query,
@@ -51,5 +77,9 @@ async def build_json_response(
         messages=messages,
         status_code=status_code,
     )
-    result = await response_builder(json_data)
+    if pagination is not None:
+        json_data["pagination"] = pagination
+        result = await response_builder(json_data, RestApiPaginatedResponse)
+    else:
+        result = await response_builder(json_data)
     return result
@@ -2,45 +2,150 @@ import asyncio
 import uuid  # For generating unique connection IDs
 
 from logger_setup import logger
+from ws_protocol import JSON_PROTOCOL, negotiate_protocol
+from ws_session import (
+    BROADCAST_BUFFER_BYTES,
+    BROADCAST_BUFFER_MESSAGES,
+    BROADCAST_CHANNEL,
+    DIRECT_CHANNEL,
+    SESSION_RESUME_TTL,
+    ReplayBuffer,
+    Session,
+    parse_last_seq,
+)
 
 HEARTBEAT_INTERVAL = 30  # seconds
 HEARTBEAT_TIMEOUT = 10  # seconds
+GOING_AWAY = 1001  # WebSocket close code sent when the server shuts down
 
 
 class ConnectionManager:
     def __init__(self):
         self.active_connections = {}  # Stores connection data by ID
-        self.cleanup_task = asyncio.create_task(self._cleanup_inactive_connections())
+        self.sessions = {}  # Resumable sessions by resume token
+        self.broadcast_buffer = ReplayBuffer(
+            BROADCAST_BUFFER_MESSAGES, BROADCAST_BUFFER_BYTES
+        )
+        self.accepting = True  # False once the server starts draining
+        self.cleanup_task = None  # Started by start(), inside the event loop
+
+    def start(self):
+        """Start removing inactive connections; call from the app lifespan. The
+        manager is created at import, which may happen before any event loop runs."""
+        if self.cleanup_task is None:
+            self.cleanup_task = asyncio.create_task(
+                self._cleanup_inactive_connections()
+            )
 
     async def connect(self, websocket):
-        """Accept the WebSocket connection, assign a unique ID, and add to active connections."""
+        """Accept the WebSocket connection, assign a unique ID, and add to active connections.
+        A client reconnecting with `?resume=<token>&broadcast=<seq>&direct=<seq>` (the
+        last sequence number it saw per channel) gets the messages it missed replayed."""
+        if not self.accepting:
+            # Closing before accept rejects the handshake; the client retries elsewhere
+            await websocket.close(code=GOING_AWAY)
+            return None
         try:
-            await websocket.accept()
+            protocol, subprotocol = negotiate_protocol(
+                websocket.scope.get("subprotocols", [])
+            )
+            await websocket.accept(subprotocol=subprotocol)
             connection_id = str(uuid.uuid4())  # Generate a unique ID for the connection
-            self.active_connections[connection_id] = {
+            data = {
                 "websocket": websocket,
+                "protocol": protocol,
                 "last_pong": asyncio.get_event_loop().time(),
                 "pong_received": True,
             }
+            session, last_seq = self._find_resumable_session(websocket.query_params)
+            resumed = session is not None
+            if session is None:
+                session = Session()
+                session.detached_at = asyncio.get_event_loop().time()  # Until attached
+                self.sessions[session.token] = session
+            elif session.connection_id is not None:
+                # The old socket of this session is still open; this one replaces it
+                await self.disconnect(session.connection_id)
+            data["session"] = session
+            await self._send_frame(
+                data,
+                protocol.encode(
+                    {
+                        "type": "connection_id",
+                        "id": connection_id,
+                        "resume_token": session.token,
+                        "resumed": resumed,
+                        "seq": {
+                            BROADCAST_CHANNEL: self.broadcast_buffer.last_seq,
+                            DIRECT_CHANNEL: session.direct_seq,
+                        },
+                    }
+                ),
+            )  # Optionally send the ID to the client
+            if resumed:
+                await self._replay(data, last_seq)
+            # Registered only once caught up, so live messages follow the replay
+            session.connection_id = connection_id
+            session.detached_at = None
+            self.active_connections[connection_id] = data
             logger.info(
-                f"New WebSocket connection with ID {connection_id}. "
+                f"New WebSocket connection with ID {connection_id} ({protocol.name}"
+                f"{', resumed' if resumed else ''}). "
                 f"Total connections: {len(self.active_connections)}"
             )
-            await websocket.send_json(
-                {"type": "connection_id", "id": connection_id}
-            )  # Optionally send the ID to the client
             return connection_id
         except Exception as e:
             logger.error(f"Error during WebSocket accept: {e}")
             await self.disconnect_by_websocket(websocket)
 
-    async def disconnect(self, connection_id):
-        """Safely disconnect the WebSocket using its connection ID."""
+    def _find_resumable_session(self, params):
+        """The session named by the `resume` token and the last sequence numbers
+        the client saw, or (None, None) if it cannot be resumed without gaps."""
+        session = self.sessions.get(params.get("resume") or "")
+        if session is None:
+            return None, None
+        last_seq = {
+            BROADCAST_CHANNEL: parse_last_seq(params.get(BROADCAST_CHANNEL)),
+            DIRECT_CHANNEL: parse_last_seq(params.get(DIRECT_CHANNEL)),
+        }
+        if (
+            None in last_seq.values()
+            or self.broadcast_buffer.since(last_seq[BROADCAST_CHANNEL]) is None
+            or session.direct_buffer.since(last_seq[DIRECT_CHANNEL]) is None
+        ):
+            return None, None
+        return session, last_seq
+
+    async def _replay(self, data, last_seq):
+        """Send the messages missed since `last_seq`, including any broadcast while
+        replaying, until the connection has caught up."""
+        session = data["session"]
+        while True:
+            broadcasts = self.broadcast_buffer.since(last_seq[BROADCAST_CHANNEL])
+            directs = session.direct_buffer.since(last_seq[DIRECT_CHANNEL])
+            if broadcasts is None or directs is None:
+                # Fell behind the buffer while replaying
+                await self._send_frame(
+                    data, data["protocol"].encode({"type": "resync_required"})
+                )
+                return
+            if not broadcasts and not directs:
+                return
+            for message in broadcasts + directs:
+                await self._send_frame(data, data["protocol"].encode(message))
+                last_seq[message["channel"]] = message["seq"]
+
+    async def disconnect(self, connection_id, code=1000):
+        """Safely disconnect the WebSocket using its connection ID. Its session stays
+        resumable for SESSION_RESUME_TTL seconds."""
         if connection_id in self.active_connections:
-            websocket = self.active_connections[connection_id]["websocket"]
-            del self.active_connections[connection_id]
+            data = self.active_connections.pop(connection_id)
+            session = data["session"]
+            if session.connection_id == connection_id:
+                session.connection_id = None
+                session.detached_at = asyncio.get_event_loop().time()
             try:
-                await websocket.close()
+                await data["websocket"].close(code=code)
             except Exception as e:
                 logger.error(f"Error while closing WebSocket {connection_id}: {e}")
             logger.info(
@@ -48,6 +153,19 @@ class ConnectionManager:
                 f"Total connections: {len(self.active_connections)}"
             )
 
+    async def drain(self):
+        """Stop accepting connections and close the open ones with 1001 (going away)."""
+        self.accepting = False
+        if self.cleanup_task is not None:
+            self.cleanup_task.cancel()
+        await asyncio.gather(
+            *[
+                self.disconnect(connection_id, code=GOING_AWAY)
+                for connection_id in list(self.active_connections)
+            ]
+        )
+        logger.info("WebSocket connections drained")
+
     async def disconnect_by_websocket(self, websocket):
         """Disconnect by WebSocket object if connection ID is unknown."""
         connection_id = self.get_connection_id_by_websocket(websocket)
@@ -61,22 +179,41 @@ class ConnectionManager:
                 return connection_id
         return None
 
+    def get_protocol(self, connection_id):
+        """The message protocol negotiated for the connection."""
+        return self.active_connections[connection_id]["protocol"]
+
     async def send_message(self, connection_id, message):
-        """Send a JSON message to the WebSocket identified by connection ID."""
+        """Send a message to the WebSocket identified by connection ID."""
         if connection_id in self.active_connections:
-            websocket = self.active_connections[connection_id]["websocket"]
+            data = self.active_connections[connection_id]
+            session = data["session"]
+            seq = session.next_direct_seq()
+            message = {**message, "channel": DIRECT_CHANNEL, "seq": seq}
+            frame = data["protocol"].encode(message)
+            session.direct_buffer.append(seq, message, len(frame))
             try:
-                await websocket.send_json(message)
+                await self._send_frame(data, frame)
             except Exception as e:
                 logger.error(f"Error sending message to WebSocket {connection_id}: {e}")
                 await self.disconnect(connection_id)
 
     async def broadcast(self, message):
         """Broadcast a message to all active WebSocket connections."""
+        seq = self.broadcast_buffer.last_seq + 1
+        message = {**message, "channel": BROADCAST_CHANNEL, "seq": seq}
+        frames = {}  # Encoded once per protocol, shared by all its recipients
+        for data in self.active_connections.values():
+            protocol = data["protocol"]
+            if protocol.name not in frames:
+                frames[protocol.name] = protocol.encode(message)
+        # Kept for replay; the size of any encoding is a good enough memory estimate
+        size = len(next(iter(frames.values()), None) or JSON_PROTOCOL.encode(message))
+        self.broadcast_buffer.append(seq, message, size)
         websockets_to_remove = await asyncio.gather(
             *[
-                self._safe_send(connection_id, message)
-                for connection_id in self.active_connections
+                self._safe_send(connection_id, frames[data["protocol"].name])
+                for connection_id, data in self.active_connections.items()
             ]
         )
         await asyncio.gather(
@@ -117,14 +254,20 @@ class ConnectionManager:
             logger.error(f"Error sending ping to WebSocket {connection_id}: {e}")
             return connection_id
 
-    async def _safe_send(self, connection_id, message):
-        """Safely send a message to the WebSocket, catching errors."""
-        websocket = self.active_connections[connection_id]["websocket"]
+    async def _safe_send(self, connection_id, frame):
+        """Safely send an encoded frame to the WebSocket, catching errors."""
         try:
-            await websocket.send_json(message)
+            await self._send_frame(self.active_connections[connection_id], frame)
         except Exception:
             return connection_id
 
+    async def _send_frame(self, data, frame):
+        """Send an already encoded message as a binary or text frame."""
+        if data["protocol"].binary:
+            await data["websocket"].send_bytes(frame)
+        else:
+            await data["websocket"].send_text(frame)
+
     async def _cleanup_inactive_connections(self):
         """Periodically remove inactive WebSockets."""
         while True:
@@ -137,6 +280,14 @@ class ConnectionManager:
             await asyncio.gather(
                 *[self.disconnect(conn_id) for conn_id in websockets_to_remove]
             )
+            expired_sessions = [
+                token
+                for token, session in self.sessions.items()
+                if session.detached_at is not None
+                and current_time - session.detached_at > SESSION_RESUME_TTL
+            ]
+            for token in expired_sessions:
+                del self.sessions[token]
             await asyncio.sleep(HEARTBEAT_INTERVAL)
 
 
@@ -0,0 +1,65 @@
+# WebSocket message encodings, negotiated with the Sec-WebSocket-Protocol header.
+# Clients asking for "msgpack" get binary MessagePack frames; everyone else (no
+# subprotocol, "json", or an unknown one) gets JSON text frames. Heartbeats stay
+# plain "ping"/"pong" text frames whatever the protocol.
+import json
+
+from starlette.websockets import WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:  # Optional dependency; JSON only without it
+    msgpack = None
+
+
+class JsonProtocol:
+    name = "json"
+    binary = False
+
+    def encode(self, message) -> str:
+        # Same compact form as WebSocket.send_json
+        return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+    def decode(self, frame: bytes):
+        return frame.decode()  # Binary frames from JSON clients are read as text
+
+
+class MsgpackProtocol:
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message) -> bytes:
+        return msgpack.packb(message)
+
+    def decode(self, frame):
+        return msgpack.unpackb(frame)
+
+
+JSON_PROTOCOL = JsonProtocol()
+
+# Server preference order
+PROTOCOLS = {
+    protocol.name: protocol
+    for protocol in (MsgpackProtocol() if msgpack else None, JSON_PROTOCOL)
+    if protocol is not None
+}
+
+
+def negotiate_protocol(requested):
+    """Pick a protocol from the client's requested subprotocols. Returns the protocol
+    and the subprotocol to confirm in the handshake (None if none was matched)."""
+    for name in PROTOCOLS:
+        if name in requested:
+            return PROTOCOLS[name], name
+    return JSON_PROTOCOL, None
+
+
+async def receive_message(websocket, protocol):
+    """Receive the next message. Text frames (including "pong") are returned as-is,
+    binary frames are decoded with the connection's protocol."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+    if message.get("text") is not None:
+        return message["text"]
+    return protocol.decode(message["bytes"])
@@ -0,0 +1,75 @@
+# Resumable WebSocket sessions.
+# Every sequenced message carries its channel and a per-channel sequence number.
+# "broadcast" messages are numbered globally and kept once in a shared ring buffer;
+# "direct" messages are numbered per session and kept in the session's own buffer.
+# A client that reconnects with its resume token and the last sequence number it saw
+# per channel gets the missed messages replayed instead of resyncing over HTTP.
+import itertools
+import secrets
+from collections import deque
+
+BROADCAST_CHANNEL = "broadcast"
+DIRECT_CHANNEL = "direct"
+
+BROADCAST_BUFFER_MESSAGES = 1000
+BROADCAST_BUFFER_BYTES = 1024 * 1024
+SESSION_BUFFER_MESSAGES = 100
+SESSION_BUFFER_BYTES = 64 * 1024
+SESSION_RESUME_TTL = 120  # seconds a detached session can be resumed
+
+
+class ReplayBuffer:
+    def __init__(self, max_messages: int, max_bytes: int):
+        """Ring buffer of the most recent messages of one channel, bounded both in
+        count and in (encoded) bytes. Sequence numbers are contiguous."""
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.last_seq = 0
+        self._messages = deque()  # (seq, message, size)
+        self._bytes = 0
+
+    def append(self, seq: int, message: dict, size: int):
+        self._messages.append((seq, message, size))
+        self._bytes += size
+        self.last_seq = seq
+        while len(self._messages) > self.max_messages or (
+            self._bytes > self.max_bytes and len(self._messages) > 1
+        ):
+            self._bytes -= self._messages.popleft()[2]
+
+    def since(self, seq: int):
+        """Messages after `seq` in order, or None if some were already evicted (or
+        `seq` was never handed out) and the client has to resync."""
+        if seq == self.last_seq:
+            return []
+        if seq > self.last_seq or not self._messages:
+            return None
+        first = self._messages[0][0]
+        if seq + 1 < first:
+            return None
+        return [
+            message
+            for _, message, _ in itertools.islice(self._messages, seq + 1 - first, None)
+        ]
+
+
+class Session:
+    def __init__(self):
+        self.token = secrets.token_urlsafe(24)
+        self.connection_id = None
+        self.detached_at = None  # Loop time the last connection went away
+        self.direct_seq = 0
+        self.direct_buffer = ReplayBuffer(SESSION_BUFFER_MESSAGES, SESSION_BUFFER_BYTES)
+
+    def next_direct_seq(self) -> int:
+        self.direct_seq += 1
+        return self.direct_seq
+
+
+def parse_last_seq(value: str | None) -> int | None:
+    """Sequence number from a query parameter; None when missing or malformed."""
+    try:
+        seq = int(value)
+    except (TypeError, ValueError):
+        return None
+    return seq if seq >= 0 else None